@@ -0,0 +1,93 @@
+import argparse
+from time import perf_counter
+
+import pandas as pd
+
+from equipments import Breaker
+from xml_reader import XmlReader, BACKENDS, lxml_etree
+from tools.logger import log
+
+
+def run_backend(f_name: str, backend: str, stream: bool, tag_list: list[str]) -> tuple[float, dict[str: pd.DataFrame]]:
+    """Разбирает файл выбранным разборщиком. Возвращает время и полученные таблицы"""
+
+    start = perf_counter()
+    xml = XmlReader(f_name, stream=stream, backend=backend)
+    tables = xml.get_data_by_list(tag_list)
+
+    return perf_counter() - start, tables
+
+
+def run_compare(first: str, second: str, encode_mrid: bool) -> tuple[float, Breaker]:
+    """Сравнивает выключатели двух файлов. Возвращает время сравнения (без разбора) и выключатели первого файла"""
+
+    breaker_first = Breaker(XmlReader(first, encode_mrid=encode_mrid))
+    breaker_second = Breaker(XmlReader(second, encode_mrid=encode_mrid))
+    breaker_first.run()
+    breaker_second.run()
+
+    start = perf_counter()
+    breaker_first.compare(breaker_second)
+
+    return perf_counter() - start, breaker_first
+
+
+def compare_benchmark(first: str, second: str, repeat: int) -> None:
+    """Время сравнения с mRID кодами словаря модели и строками"""
+
+    reference = None
+    for encode_mrid in (True, False):
+        times = []
+        for _ in range(repeat):
+            elapsed, breaker = run_compare(first, second, encode_mrid)
+            times.append(elapsed)
+
+        # Результат сравнения не зависит от хранения mRID
+        result = [breaker.compare_1.astype(str), breaker.compare_2_1.astype(str)]
+        if reference is None:
+            reference = result
+        else:
+            for df_reference, df in zip(reference, result):
+                pd.testing.assert_frame_equal(df_reference, df)
+
+        mode = 'codes' if encode_mrid else 'strings'
+        log.info(f'{first} - {second}: сравнение, mRID {mode:7} min {min(times):.3f} с, '
+                 f'среднее {sum(times) / len(times):.3f} с')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение скорости разборщиков xml и сравнения моделей')
+    parser.add_argument('files', nargs='*', help='xml-файлы для разбора')
+    parser.add_argument('--compare', nargs=2, metavar=('FIRST', 'SECOND'),
+                        help='сравнить выключатели двух файлов с mRID кодами и строками')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_benchmark(*args.compare, args.repeat)
+
+    backends = [name for name in BACKENDS if name != 'lxml' or lxml_etree is not None]
+    tag_list = Breaker(None).tables_list
+
+    for f_name in args.files:
+        reference = None
+        for backend in backends:
+            for stream in (False, True):
+                times = []
+                for _ in range(args.repeat):
+                    elapsed, tables = run_backend(f_name, backend, stream, tag_list)
+                    times.append(elapsed)
+
+                # Все разборщики должны давать одинаковые таблицы
+                if reference is None:
+                    reference = tables
+                else:
+                    for tag in tag_list:
+                        pd.testing.assert_frame_equal(reference[tag], tables[tag])
+
+                mode = 'stream' if stream else 'tree'
+                log.info(f'{f_name}: {backend:5} {mode:6} min {min(times):.3f} с, среднее {sum(times) / len(times):.3f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,87 @@
+import re
 import sys
 
 import numpy as np
 import pandas as pd
 
+from join_plan import get_left_indexer
+from tools.dtypes import EMPTY, NUMERIC_COLUMNS, to_text
 from tools.logger import log
+from xml_reader import XmlReader
+
+
+class Tolerance:
+    """Допуск сравнения числовых значений: значения равны, если |first - second| <= abs_tol + rel_tol * |second|"""
+
+    def __init__(self, abs_tol: float = 0.0, rel_tol: float = 0.0):
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+
+
+# Числовые колонки (регулярное выражение по имени) и допуски их сравнения.
+# Колонки те же, что числовые в компактных таблицах (tools.dtypes.NUMERIC_COLUMNS),
+# каталожные характеристики SwitchInfo сравниваются с относительным допуском.
+# Остальные колонки сравниваются как строки
+NUMERIC_TOLERANCES = {
+    **{re.escape(column): Tolerance(abs_tol=1e-9, rel_tol=1e-9) if column.startswith('SwitchInfo.')
+       else Tolerance(abs_tol=1e-6) for column in sorted(NUMERIC_COLUMNS)},
+    # Температурные точки свода токовых ограничений
+    r'[-0-9.]+': Tolerance(abs_tol=1e-6),
+}
+
+
+def get_tolerance(column: str, tolerances: dict[str: Tolerance]) -> Tolerance | None:
+    """Допуск сравнения колонки или None, если колонка сравнивается как строка"""
+
+    for pattern, tolerance in tolerances.items():
+        if re.fullmatch(pattern, str(column)):
+            return tolerance
+
+    return None
+
+
+def is_close(first: np.ndarray, second: np.ndarray, tolerance: Tolerance) -> np.ndarray:
+    """Поэлементное сравнение значений как чисел с допуском.
+    Если хотя бы одно из значений не число (пропуск, текст), значения не считаются равными"""
+
+    value_first = pd.to_numeric(pd.Series(first, dtype=object), errors='coerce').to_numpy(dtype=float)
+    value_second = pd.to_numeric(pd.Series(second, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+    return np.isclose(value_first, value_second, rtol=tolerance.rel_tol, atol=tolerance.abs_tol, equal_nan=False)
+
+
+def get_fingerprints(df: pd.DataFrame, compare_id: str) -> pd.Series:
+    """Отпечатки (хэши значений) строк таблицы в строковом виде, индекс - compare_id.
+    Колонки берутся по порядку имен, поэтому отпечаток не зависит от порядка колонок"""
+
+    columns = sorted((column for column in df.columns if column != compare_id), key=str)
+    text_df = pd.DataFrame({column: to_text(df[column]).astype(object).fillna(EMPTY) for column in columns})
+
+    return pd.Series(pd.util.hash_pandas_object(text_df, index=False, categorize=False).to_numpy(),
+                     index=pd.Index(df[compare_id].astype(object), name=compare_id), name='fingerprint')
 
 
 class Comparer:
-    def __init__(self, first: pd.DataFrame, second: pd.DataFrame, compare_id: str):
+    def __init__(self, first: pd.DataFrame, second: pd.DataFrame, compare_id: str,
+                 tolerances: dict[str: Tolerance] = None, second_fingerprints: pd.Series = None,
+                 match_keys: list[str] = None):
         self.first = first
         self.second = second
         self.compare_id = compare_id
+        self.tolerances = NUMERIC_TOLERANCES if tolerances is None else tolerances
+        # Готовые отпечатки строк второй таблицы (например, из снимка эталона), см. get_fingerprints
+        self.second_fingerprints = second_fingerprints
+        # Колонки естественного ключа для сопоставления строк, mRID которых не совпали,
+        # и найденные по ним пары: mRID первой таблицы -> mRID второй
+        self.match_keys = match_keys
+        self.matched = {}
+        # Набор изменений в длинном формате: одна строка на одно изменение
+        self.changes = pd.DataFrame()
 
     def run(self) -> pd.DataFrame:
         log.info('Сравнение запущено')
 
-        # Проверяем, что список столбцов одинаковый
-        ulist_1, ulist_2 = self._compare_columns_list()
-
-        # Если список столбцов разный, то приводим его в соответствие
-        self._garmonize_columns_list(ulist_1, ulist_2)
+        self._prepare()
 
         # Запуск первой сравнялки: сравниваем две таблицы поэлементно
         compare_1_df = self._compare_1()
@@ -28,6 +90,51 @@ class Comparer:
 
         return compare_1_df
 
+    def run_changes(self) -> pd.DataFrame:
+        """Сравнение без сборки широкой таблицы: возвращает только набор изменений
+        (compare_id, column, old, new, compare_flg)"""
+
+        log.info('Сравнение запущено (набор изменений)')
+
+        self._prepare()
+
+        mRID_df = self._find_intersect_mRID()
+        chg_mRID = mRID_df.loc[mRID_df['compare_flg'] == 'Изменено', self.compare_id].tolist()
+        first_, second_, changed = self._find_changes(chg_mRID)
+        self.changes = self._get_change_set(mRID_df, first_, second_, changed)
+
+        log.info('Сравнение завершено')
+
+        return self.changes
+
+    def get_change_counts(self) -> pd.DataFrame:
+        """Количество изменений по колонкам (строки) и признакам изменения (колонки)"""
+
+        if self.changes.empty:
+            return pd.DataFrame()
+
+        return (self.changes
+                .groupby(['column', 'compare_flg'], observed=True)
+                .size()
+                .unstack(fill_value=0))
+
+    def _prepare(self) -> None:
+        # Проверяем, что список столбцов одинаковый
+        ulist_1, ulist_2 = self._compare_columns_list()
+
+        # Если список столбцов разный, то приводим его в соответствие
+        self._garmonize_columns_list(ulist_1, ulist_2)
+        if ulist_1 or ulist_2:
+            # В отпечатках второй таблицы нет добавленных колонок
+            self.second_fingerprints = None
+
+        # Коды mRID двух моделей приводим к общему набору категорий
+        self._harmonize_categories()
+
+        # Строки с несовпавшими mRID сопоставляем по естественному ключу
+        if self.match_keys:
+            self._match_by_keys()
+
     def _compare_1(self) -> pd.DataFrame:
         """Первая сравнялка для вывода таблицы с изменившимися/не изменившимися значениями"""
 
@@ -43,22 +150,32 @@ class Comparer:
         del_mRID = mRID_df.loc[mRID_df['compare_flg'] == 'Удалено', self.compare_id].tolist()
 
         # Сравниваем только общие mRID
-        chg_df = self._compare_change(chg_mRID)
+        first_, second_, changed = self._find_changes(chg_mRID)
+        chg_df = self._compare_change(first_, second_, changed)
+        self.changes = self._get_change_set(mRID_df, first_, second_, changed)
 
         # Собираем финальный датафрейм
         final_cng_df = mRID_df.merge(chg_df, on=self.compare_id, how='inner')
 
-        final_add_df = (mRID_df
-                        .merge(self.first[self.first[self.compare_id].isin(add_mRID)], on=self.compare_id, how='inner')
-                        )
+        final_add_df = self._merge_on_id(mRID_df, self.first[self.first[self.compare_id].isin(add_mRID)], how='inner')
+
+        final_del_df = self._merge_on_id(mRID_df, self.second[self.second[self.compare_id].isin(del_mRID)],
+                                         how='inner')
 
-        final_del_df = (mRID_df
-                        .merge(self.second[self.second[self.compare_id].isin(del_mRID)], on=self.compare_id,
-                               how='inner')
-                        )
+        # Изменившиеся строки собраны строками. Те же колонки добавленных и удаленных строк приводим к строкам
+        # до pd.concat, иначе общий тип категориальной и строковой колонки pandas ищет по хэшу всех категорий
+        text_columns = {column for column, dtype in final_cng_df.dtypes.items() if dtype == object}
+        final_add_df = final_add_df.astype({column: object for column in final_add_df if column in text_columns})
+        final_del_df = final_del_df.astype({column: object for column in final_del_df if column in text_columns})
 
         final_df = pd.concat([final_cng_df, final_add_df, final_del_df], axis=0, ignore_index=True)
 
+        if self.matched:
+            # Для сопоставленных по ключу строк выводим оба mRID через разделитель
+            mrid = final_df[self.compare_id].astype(object)
+            mrid_second = mrid.map(self.matched)
+            final_df[self.compare_id] = mrid.where(mrid_second.isna(), mrid + '&\n' + mrid_second)
+
         return final_df
 
     def _compare_columns_list(self) -> tuple[list[str], list[str]]:
@@ -97,12 +214,135 @@ class Comparer:
                 self.first[column] = 'EMPTY'
             log.info(f'В первый датафрейм добавлены колонки {ulist_2}')
 
+    def _harmonize_categories(self) -> None:
+        """Категориальные колонки (mRID) двух таблиц перекодирует к общему набору категорий,
+        чтобы сравнение и соединение шли по кодам. Если колонка категориальная
+        только в одной таблице, она переводится в строки"""
+
+        first = self.first.copy(deep=False)
+        second = self.second.copy(deep=False)
+
+        categorical = [column for column in first.columns
+                       if isinstance(first[column].dtype, pd.CategoricalDtype)
+                       and isinstance(second[column].dtype, pd.CategoricalDtype)]
+        for df in (first, second):
+            for column in df.columns:
+                if isinstance(df[column].dtype, pd.CategoricalDtype) and column not in categorical:
+                    df[column] = df[column].astype(object)
+
+        if not categorical:
+            self.first, self.second = first, second
+            return
+
+        # Исходные наборы категорий (словари mRID моделей) и используемые в таблицах значения каждого из них.
+        # pandas создает отдельный тип для каждой колонки, но индекс категорий у колонок одной модели общий
+        sources = []
+        used = []
+        source_ids = {}
+        for df_id, df in enumerate((first, second)):
+            for column in categorical:
+                categories = df[column].cat.categories
+                source_id = next((i for i, known in enumerate(sources)
+                                  if known is categories or known.equals(categories)), None)
+                if source_id is None:
+                    source_id = len(sources)
+                    sources.append(categories)
+                    used.append(np.zeros(len(categories), dtype=bool))
+                source_ids[df_id, column] = source_id
+                codes = df[column].cat.codes.to_numpy()
+                used[source_id][codes[codes >= 0]] = True
+
+        # Категории уже общие (таблицы одной модели или уже приведенные): перекодировать нечего.
+        # EMPTY нужен среди категорий, чтобы заполнить пропуски перед сравнением
+        if len(sources) == 1 and EMPTY in sources[0]:
+            self.first, self.second = first, second
+            return
+
+        # Общий набор категорий по всем используемым значениям обеих таблиц. Значения не сортируются:
+        # сортировка строк словаря дороже, чем упорядочить по значению только строки результата (см. _merge_on_id)
+        union = pd.Index(pd.unique(np.concatenate(
+            [np.array([EMPTY], dtype=object)]
+            + [categories.to_numpy(dtype=object)[mask] for categories, mask in zip(sources, used)])))
+        union_dtype = pd.CategoricalDtype(categories=union)
+
+        # Перекодировка: для каждого исходного набора категорий - одна таблица старый код -> новый код
+        recoders = []
+        for categories, mask in zip(sources, used):
+            recoder = np.full(len(categories), -1, dtype=np.int64)
+            recoder[mask] = union.get_indexer(categories[mask])
+            recoders.append(recoder)
+
+        for df_id, df in enumerate((first, second)):
+            for column in categorical:
+                codes = df[column].cat.codes.to_numpy()
+                new_codes = np.where(codes == -1, -1, recoders[source_ids[df_id, column]][codes])
+                df[column] = pd.Categorical.from_codes(new_codes, dtype=union_dtype)
+
+        self.first, self.second = first, second
+
+    def _match_by_keys(self) -> None:
+        """Сопоставляет строки, mRID которых есть только в одной из таблиц, по естественному ключу match_keys
+        (например, при повторной выгрузке модели с новыми mRID). Строки группируются (блокируются) по ключу,
+        пара образуется, только если в блоке ровно по одной строке каждой таблицы, поэтому сопоставление
+        линейное и не перебирает все пары. mRID сопоставленных строк второй таблицы заменяются на mRID первой,
+        дальше такие строки сравниваются поэлементно как общие"""
+
+        only_first = self.first[~self.first[self.compare_id].isin(self.second[self.compare_id])]
+        only_second = self.second[~self.second[self.compare_id].isin(self.first[self.compare_id])]
+        if only_first.empty or only_second.empty:
+            return
+
+        key_first = self._get_match_key(only_first)
+        key_second = self._get_match_key(only_second)
+
+        # Блоки, в которых ключ однозначен в обеих таблицах
+        unique_first = key_first[key_first.notna() & ~key_first.duplicated(keep=False)]
+        unique_second = key_second[key_second.notna() & ~key_second.duplicated(keep=False)]
+        pairs = pd.merge(pd.DataFrame({'key': unique_first.to_numpy(),
+                                       'first': only_first.loc[unique_first.index, self.compare_id].astype(object)}),
+                         pd.DataFrame({'key': unique_second.to_numpy(),
+                                       'second': only_second.loc[unique_second.index, self.compare_id].astype(object)}),
+                         on='key', how='inner')
+
+        ambiguous = key_first.notna().sum() + key_second.notna().sum() - len(unique_first) - len(unique_second)
+        log.info(f'По ключу {self.match_keys} сопоставлено строк: {len(pairs)}, неоднозначных ключей: {ambiguous}')
+        if pairs.empty:
+            return
+
+        matched = dict(zip(pairs['first'], pairs['second']))
+        self.matched.update(matched)
+
+        # Во второй таблице mRID сопоставленных строк заменяем на mRID первой
+        mrid = self.second[self.compare_id]
+        new_mrid = mrid.astype(object).map(dict(zip(pairs['second'], pairs['first']))).fillna(mrid.astype(object))
+        if isinstance(mrid.dtype, pd.CategoricalDtype):
+            new_mrid = new_mrid.astype(mrid.dtype)
+        self.second = self.second.copy(deep=False)
+        self.second[self.compare_id] = new_mrid
+
+        if self.second_fingerprints is not None:
+            self.second_fingerprints = self.second_fingerprints.rename(index=dict(zip(pairs['second'], pairs['first'])))
+
+    def _get_match_key(self, df: pd.DataFrame) -> pd.Series:
+        """Естественный ключ строк: значения match_keys без учета регистра и лишних пробелов.
+        Если хотя бы одно значение ключа пустое, ключ - пропуск"""
+
+        key = None
+        empty = np.zeros(len(df), dtype=bool)
+        for column in self.match_keys:
+            values = to_text(df[column]).astype(object).fillna(EMPTY)
+            empty |= (values == EMPTY).to_numpy() | (values == '').to_numpy()
+            values = values.astype(str).str.strip().str.casefold().str.replace(r'\s+', ' ', regex=True)
+            key = values if key is None else key + '\x1f' + values
+
+        return key.where(~empty)
+
     def _find_intersect_mRID(self) -> pd.DataFrame:
         """Возвращает датафрейм, в котором помечено какие mRID общие для двух таблиц (Изменено),
         какие есть только в левой (Добавлено) и какие есть только в правой таблице (Удалено)"""
 
-        merged_df = pd.merge(self.first[[self.compare_id]], self.second[[self.compare_id]],
-                             on=self.compare_id, how='outer', indicator=True)
+        merged_df = self._merge_on_id(self.first[[self.compare_id]], self.second[[self.compare_id]],
+                                      how='outer', indicator=True)
 
         category_mapping = {'both': 'Изменено', 'left_only': 'Добавлено', 'right_only': 'Удалено'}
         merged_df['compare_flg'] = merged_df['_merge'].cat.rename_categories(category_mapping)
@@ -111,54 +351,293 @@ class Comparer:
 
         return merged_df
 
-    def _compare_change(self, mrid_list: list[str]) -> pd.DataFrame:
+    def _merge_on_id(self, left: pd.DataFrame, right: pd.DataFrame, how: str, indicator: bool = False) -> pd.DataFrame:
+        """Соединение таблиц по compare_id. Категориальные ключи с общими категориями (после приведения категорий)
+        соединяются по кодам: соединение по категориальному ключу pandas начинает со сравнения хэшей всех категорий.
+        Порядок строк такой же, как при соединении строк mRID"""
+
+        left_key = left[self.compare_id]
+        right_key = right[self.compare_id]
+        if not (isinstance(left_key.dtype, pd.CategoricalDtype) and isinstance(right_key.dtype, pd.CategoricalDtype)
+                and left_key.cat.categories.equals(right_key.cat.categories)):
+            return pd.merge(left, right, on=self.compare_id, how=how, indicator=indicator)
+
+        merged_df = pd.merge(left.assign(**{self.compare_id: left_key.cat.codes}),
+                             right.assign(**{self.compare_id: right_key.cat.codes}),
+                             on=self.compare_id, how=how, indicator=indicator)
+        merged_df[self.compare_id] = pd.Categorical.from_codes(merged_df[self.compare_id], dtype=left_key.dtype)
+
+        if how == 'outer':
+            # Внешнее соединение упорядочивает строки по ключу, а коды не упорядочены по значению mRID
+            order = np.argsort(merged_df[self.compare_id].to_numpy(dtype=object), kind='stable')
+            merged_df = merged_df.take(order).reset_index(drop=True)
+
+        return merged_df
+
+    def _find_changes(self, mrid_list: list[str]) -> tuple[pd.DataFrame, pd.DataFrame, dict[str: np.ndarray]]:
+        """Выравнивает строки второй таблицы по mRID первой и находит изменившиеся ячейки.
+        Возвращает обе таблицы в строковом виде и для каждой колонки позиции изменившихся строк"""
+
+        first_ = self.first[self.first[self.compare_id].isin(mrid_list)].reset_index(drop=True)
+        second_ = self.second[self.second[self.compare_id].isin(mrid_list)].reset_index(drop=True)
+
+        # Позиции строк второй таблицы для каждой строки первой (как при левом соединении по mRID)
+        left_pos, right_pos = get_left_indexer(first_[self.compare_id].array, second_[self.compare_id])
+        if left_pos is not None:
+            first_ = first_.take(left_pos).reset_index(drop=True)
+        second_ = second_.reindex(right_pos).reset_index(drop=True)
+
+        columns = [column for column in first_.columns if column != self.compare_id]
+
+        # Компактные типы (числа, boolean, строки) сравниваем в строковом виде
+        first_ = pd.DataFrame({column: to_text(first_[column]).fillna(EMPTY) for column in columns}
+                              | {self.compare_id: first_[self.compare_id]})
+        second_ = pd.DataFrame({column: to_text(second_[column]).fillna(EMPTY) for column in columns})
+
+        # Поячеечно сравниваем только строки, у которых различаются отпечатки
+        if self.second_fingerprints is not None and self.second_fingerprints.index.is_unique:
+            fingerprints = get_fingerprints(first_, self.compare_id)
+            second_fingerprints = self.second_fingerprints.reindex(fingerprints.index)
+            changed_rows = np.flatnonzero(fingerprints.to_numpy() != second_fingerprints.to_numpy())
+        else:
+            changed_rows = np.flatnonzero(self._get_changed_rows(first_[columns], second_[columns]))
+        log.info(f'Строк с изменениями: {len(changed_rows)} из {len(first_)}')
+
+        changed = {}
+        for column in columns:
+            positions = changed_rows
+            if len(positions) > 0:
+                positions = positions[self._not_equal(first_[column].iloc[positions],
+                                                      second_[column].iloc[positions])]
+
+            # Числовые значения, отличающиеся только записью (630 и 630.0) или в пределах допуска, не изменены
+            tolerance = get_tolerance(column, self.tolerances)
+            if tolerance is not None and len(positions) > 0:
+                positions = positions[~is_close(first_[column].iloc[positions].to_numpy(),
+                                                second_[column].iloc[positions].to_numpy(), tolerance)]
+
+            changed[column] = positions
+
+        return first_, second_, changed
+
+    def _compare_change(self, first_: pd.DataFrame, second_: pd.DataFrame,
+                        changed: dict[str: np.ndarray]) -> pd.DataFrame:
         """Сравнивает две таблицы на наличие изменений значений ячеек. Если значения одинаковые, то они выводятся.
          Если значения отличаются, то они выводятся через разделитель separator"""
 
         separator = '&'
 
-        first_ = self.first[self.first[self.compare_id].isin(mrid_list)]
-        second_ = self.second[self.second[self.compare_id].isin(mrid_list)]
+        result = {self.compare_id: first_[self.compare_id].astype(object)}
+        for column, positions in changed.items():
+            values = first_[column].astype(object)
+            if len(positions) > 0:
+                # Строки с разделителем собираем только для изменившихся ячеек
+                values = values.copy()
+                values.iloc[positions] = (values.iloc[positions]
+                                          + f'{separator}\n'
+                                          + second_[column].iloc[positions].astype(object))
+            result[column] = values
 
-        first_ = first_.fillna('EMPTY')
-        second_ = second_.fillna('EMPTY')
+        result_df = pd.DataFrame(result)
 
-        result_df = first_[self.compare_id].to_frame()
+        result_df = result_df.replace(EMPTY, '')
 
-        for column in first_.columns:
-            if column == self.compare_id:
+        return result_df
+
+    def _get_change_set(self, mRID_df: pd.DataFrame, first_: pd.DataFrame, second_: pd.DataFrame,
+                        changed: dict[str: np.ndarray]) -> pd.DataFrame:
+        """Набор изменений в длинном формате: одна строка на изменившуюся ячейку общих mRID
+        (old - значение второй таблицы, new - первой) и одна строка на добавленный или удаленный mRID"""
+
+        mrid = first_[self.compare_id].astype(object).to_numpy()
+
+        parts = []
+        for column, positions in changed.items():
+            if len(positions) == 0:
                 continue
+            parts.append(pd.DataFrame({
+                self.compare_id: mrid[positions],
+                'column': column,
+                'old': second_[column].iloc[positions].astype(object).to_numpy(),
+                'new': first_[column].iloc[positions].astype(object).to_numpy(),
+                'compare_flg': 'Изменено',
+            }))
+
+        # Сопоставленные по ключу строки - изменение compare_id
+        if self.matched:
+            parts.append(pd.DataFrame({self.compare_id: list(self.matched), 'column': self.compare_id,
+                                       'old': list(self.matched.values()), 'new': list(self.matched),
+                                       'compare_flg': 'Изменено'}))
+
+        # Добавленное и удаленное оборудование - одной строкой по колонке compare_id
+        added = mRID_df.loc[mRID_df['compare_flg'] == 'Добавлено', self.compare_id].astype(object).to_numpy()
+        deleted = mRID_df.loc[mRID_df['compare_flg'] == 'Удалено', self.compare_id].astype(object).to_numpy()
+        parts.append(pd.DataFrame({self.compare_id: added, 'column': self.compare_id,
+                                   'old': EMPTY, 'new': added, 'compare_flg': 'Добавлено'}))
+        parts.append(pd.DataFrame({self.compare_id: deleted, 'column': self.compare_id,
+                                   'old': deleted, 'new': EMPTY, 'compare_flg': 'Удалено'}))
+
+        changes = pd.concat(parts, axis=0, ignore_index=True)
+        changes[['old', 'new']] = changes[['old', 'new']].replace(EMPTY, '')
+        changes['column'] = changes['column'].astype('category')
+        changes['compare_flg'] = changes['compare_flg'].astype('category')
+
+        log.info(f'Изменений: {len(changes)}')
+
+        return changes
+
+    @staticmethod
+    def _get_changed_rows(first: pd.DataFrame, second: pd.DataFrame) -> np.ndarray:
+        """Сравнивает отпечатки (хэши значений) строк двух выровненных таблиц.
+        Возвращает маску строк, в которых есть изменения"""
 
-            temp_df = first_[[self.compare_id, column]].merge(second_[[self.compare_id, column]],
-                                                              on=self.compare_id, how='left',
-                                                              suffixes=('_first', '_second')
-                                                              )
+        if len(first.columns) == 0:
+            return np.zeros(len(first), dtype=bool)
 
-            temp_df[f'{column}_compare'] = np.where(temp_df[f'{column}_first'] == temp_df[f'{column}_second'],
-                                                    temp_df[f'{column}_first'],
-                                                    (temp_df[f'{column}_first']
-                                                     + f'{separator}\n'
-                                                     + temp_df[f'{column}_second']))
+        # Категориальные колонки с общими категориями хэшируем по кодам, без хэширования словаря категорий
+        first = first.copy(deep=False)
+        second = second.copy(deep=False)
+        for column in first.columns:
+            if isinstance(first[column].dtype, pd.CategoricalDtype) and \
+                    isinstance(second[column].dtype, pd.CategoricalDtype) and \
+                    first[column].cat.categories.equals(second[column].cat.categories):
+                first[column] = first[column].cat.codes
+                second[column] = second[column].cat.codes
 
-            result_df = result_df.merge(temp_df[[self.compare_id, f'{column}_compare']],
-                                        on=self.compare_id, how='left'
-                                        )
+        hash_first = pd.util.hash_pandas_object(first, index=False).to_numpy()
+        hash_second = pd.util.hash_pandas_object(second, index=False).to_numpy()
 
-        result_column = [col.replace('_compare', '') for col in result_df.columns]
-        result_df.columns = result_column
+        return hash_first != hash_second
 
-        result_df = result_df.replace('EMPTY', '')
+    @staticmethod
+    def _not_equal(first: pd.Series, second: pd.Series) -> np.ndarray:
+        """Поэлементное сравнение колонок. Категориальные колонки с общими категориями сравниваются по кодам"""
 
-        return result_df
+        if isinstance(first.dtype, pd.CategoricalDtype) and isinstance(second.dtype, pd.CategoricalDtype) and \
+                first.cat.categories.equals(second.cat.categories):
+            return first.cat.codes.to_numpy() != second.cat.codes.to_numpy()
+
+        return (first != second).to_numpy()
 
     @staticmethod
-    def check_xml(xml_txt: str):
+    def check_xml(xml: XmlReader):
         """Если xml содержит ParentObject, то это ошибка"""
 
         check_substring = 'ParentObject'
-        if check_substring in xml_txt:
+        if xml.contains(check_substring):
             log.error(f'Объект содержит {check_substring}')
             # sys.exit(-1)
         else:
             log.info(f'Объект не содержит {check_substring}')
 
+
+class VersionComparer:
+    """Сравнение нескольких версий одной таблицы (ревизий одного объекта) за один проход.
+    Версии передаются по порядку ревизий, от ранней к поздней. Каждая версия сравнивается с предыдущей,
+    результат - история изменений: в какой ревизии изменилось каждое значение"""
+
+    def __init__(self, versions: list[pd.DataFrame], compare_id: str, names: list[str] = None,
+                 tolerances: dict[str: Tolerance] = None):
+        if len(versions) < 2:
+            raise ValueError('Для сравнения нужно не меньше двух версий')
+
+        names = [str(i) for i in range(len(versions))] if names is None else list(names)
+        if len(names) != len(versions) or len(set(names)) != len(names):
+            raise ValueError('Имена версий должны быть уникальны и заданы для каждой версии')
+
+        self.versions = versions
+        self.compare_id = compare_id
+        self.names = names
+        self.tolerances = NUMERIC_TOLERANCES if tolerances is None else tolerances
+        # История изменений в длинном формате: одна строка на одно изменение в одной ревизии
+        self.history = pd.DataFrame()
+
+    def run(self) -> pd.DataFrame:
+        """Возвращает историю изменений (compare_id, column, revision, old, new, compare_flg).
+        revision - имя версии, в которой значение стало new"""
+
+        log.info(f'Сравнение {len(self.versions)} версий запущено')
+
+        # Общий список mRID всех версий и позиции строк каждой версии в нем (-1 - mRID в версии нет)
+        mrids = []
+        for name, df in zip(self.names, self.versions):
+            mrid = df[self.compare_id].astype(object)
+            if mrid.duplicated().any():
+                log.warning(f'В версии {name} повторяются {self.compare_id}, сравнивается первая строка')
+            mrids.append(pd.Index(mrid))
+        index = pd.Index(pd.unique(np.concatenate([mrid.to_numpy() for mrid in mrids])), name=self.compare_id)
+        positions = [self._get_first_positions(mrid, index) for mrid in mrids]
+        present = np.stack([pos >= 0 for pos in positions])
+        revisions = np.array(self.names, dtype=object)
+
+        parts = []
+
+        # Добавленное и удаленное оборудование - одной строкой по колонке compare_id
+        rev, pos = np.nonzero(present[1:] & ~present[:-1])
+        parts.append(pd.DataFrame({self.compare_id: index[pos], 'column': self.compare_id,
+                                   'revision': revisions[rev + 1], 'old': '', 'new': index[pos],
+                                   'compare_flg': 'Добавлено'}))
+        rev, pos = np.nonzero(~present[1:] & present[:-1])
+        parts.append(pd.DataFrame({self.compare_id: index[pos], 'column': self.compare_id,
+                                   'revision': revisions[rev + 1], 'old': index[pos], 'new': '',
+                                   'compare_flg': 'Удалено'}))
+
+        # Изменения значений: значения колонки всех версий - одна матрица версия x mRID,
+        # коды значений сравниваются с предыдущей версией сразу для всех ревизий
+        columns = pd.unique(np.array([column for df in self.versions for column in df.columns
+                                      if column != self.compare_id], dtype=object))
+        for column in columns:
+            values = np.full(present.shape, EMPTY, dtype=object)
+            for k, (df, pos) in enumerate(zip(self.versions, positions)):
+                if column in df.columns:
+                    text = to_text(df[column]).astype(object).fillna(EMPTY).to_numpy()
+                    values[k, pos >= 0] = text[pos[pos >= 0]]
+
+            codes = pd.factorize(values.ravel())[0].reshape(values.shape)
+            changed = (codes[1:] != codes[:-1]) & present[1:] & present[:-1]
+
+            rev, pos = np.nonzero(changed)
+            tolerance = get_tolerance(column, self.tolerances)
+            if tolerance is not None and len(rev) > 0:
+                close = is_close(values[rev + 1, pos], values[rev, pos], tolerance)
+                rev, pos = rev[~close], pos[~close]
+
+            parts.append(pd.DataFrame({
+                self.compare_id: index[pos], 'column': column, 'revision': revisions[rev + 1],
+                'old': values[rev, pos], 'new': values[rev + 1, pos], 'compare_flg': 'Изменено',
+            }))
+
+        history = pd.concat(parts, axis=0, ignore_index=True)
+        history[['old', 'new']] = history[['old', 'new']].replace(EMPTY, '')
+        history['column'] = history['column'].astype('category')
+        history['revision'] = pd.Categorical(history['revision'], categories=self.names, ordered=True)
+        history['compare_flg'] = history['compare_flg'].astype('category')
+        self.history = history.sort_values('revision', kind='stable').reset_index(drop=True)
+
+        log.info(f'Сравнение версий завершено, изменений: {len(self.history)}')
+
+        return self.history
+
+    def get_last_revisions(self) -> pd.DataFrame:
+        """Для каждого mRID (строки) и колонки - имя последней ревизии, в которой изменилось значение"""
+
+        changed = self.history[self.history['compare_flg'] == 'Изменено']
+        if changed.empty:
+            return pd.DataFrame()
+
+        return (changed
+                .groupby([self.compare_id, 'column'], observed=True, sort=False)['revision']
+                .last()
+                .unstack('column')
+                .astype(object)
+                .fillna(''))
+
+    @staticmethod
+    def _get_first_positions(mrid: pd.Index, index: pd.Index) -> np.ndarray:
+        """Позиции в mrid первых строк с каждым mRID из index, -1 - mRID нет"""
+
+        first = ~mrid.duplicated()
+        first_positions = np.flatnonzero(first)
+        pos = mrid[first].get_indexer(index)
+
+        return np.where(pos >= 0, first_positions[pos], -1)
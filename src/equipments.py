@@ -1,20 +1,48 @@
 from __future__ import annotations
 
+import os
 import re
 from abc import ABC, abstractmethod
 from datetime import datetime
+from types import MappingProxyType
 
-from comparer import Comparer
-from xml_reader import XmlReader
+from comparer import Comparer, VersionComparer, get_fingerprints
+from join_plan import JoinPlan, JoinStep
+from reachability import Link, get_reachable_tables
+from xml_reader import XmlReader, PARSER_VERSION
 from ideal_equipments import *
+from tools.cache import TableCache
+from tools.excel import Sheet, write_workbooks
+from tools.export import read_manifest, read_tables, write_tables
 from tools.logger import log
 
 
+# Файлы-словари и теги, которые из них читаются
+DICT_FILES = {
+    r'dict\base_voltage.xml': ['BaseVoltage'],
+    r'dict\operational_limit_type.xml': ['OperationalLimitType'],
+    r'dict\database_ProductAssetModel.xml': ['Manufacturer', 'ProductAssetModel', 'Organisation']
+}
+
+# Словари, прочитанные в этом процессе: имя файла -> ((mtime, size), {tag_dict: pd.DataFrame})
+_dict_cache = {}
+
+
 class BaseEquipment(ABC):
-    def __init__(self, xml: XmlReader):
+    # Фактуры, которые сохраняются в снимок, и ключ сравнения тех из них, что сравниваются
+    snapshot_tables = {}
+    # Таблицы, которые выгружаются в колоночные форматы (невычисленные пропускаются)
+    export_tables = ['appendix_1', 'appendix_2_1', 'appendix_2_2', 'appendix_2_2_pivot',
+                     'compare_1', 'compare_2_1', 'changes_1', 'changes_2_1']
+
+    def __init__(self, xml: XmlReader, filtered: bool = False):
         self.mRID = None
         self.xml = xml
         self.tables_list = []
+        # В режиме отбора в таблицах остаются только объекты, связанные с объектами root_tag по ссылкам links
+        self.filtered = filtered
+        self.root_tag = None
+        self.links = []
         self.appendix_1 = pd.DataFrame()
         self.appendix_2_1 = pd.DataFrame()
         self.appendix_2_2 = pd.DataFrame()
@@ -22,56 +50,183 @@ class BaseEquipment(ABC):
 
         self.compare_1 = pd.DataFrame()
         self.compare_2_1 = pd.DataFrame()
-
-    def run(self) -> None:
-        """По набору тэгов собирает информацию об оборудовании"""
+        # Наборы изменений в длинном формате (mRID, колонка, старое и новое значение, признак изменения)
+        self.changes_1 = pd.DataFrame()
+        self.changes_2_1 = pd.DataFrame()
+        # Сведения о снимке и отпечатки строк фактур (имя фактуры -> pd.Series), если оборудование загружено из снимка
+        self.snapshot_meta = None
+        self.fingerprints = {}
+        # Файл, с которым сравнивалось оборудование: имя и хэш содержимого
+        self.compared_with = None
+
+    def run(self, tags: TagRegistry = None) -> None:
+        """По набору тэгов собирает информацию об оборудовании.
+        Реестр тегов можно передать от другого оборудования того же файла, тогда общие теги не пересчитываются"""
         # Читаем список тегов из xml
-        table_dict = self.xml.get_data_by_list(self.tables_list)
+        if tags is None:
+            tags = TagRegistry(self._get_dict_df())
+        elif self.filtered:
+            raise ValueError('Отобранные таблицы нельзя добавлять в общий реестр тегов')
+
+        missing_tags = [tag for tag in self.tables_list if tag not in tags.tables]
+        if missing_tags:
+            # Из xml извлекаются только колонки, которые используют классы тегов
+            schema = get_schema(missing_tags)
+            if self.filtered:
+                tags.add_tables(get_reachable_tables(self.xml, missing_tags, schema, self.root_tag, self.links))
+            else:
+                tags.add_tables(self.xml.get_data_by_list(missing_tags, schema))
 
         # Объединяем все таблицы
-        self._create_appendix(table_dict)
+        self._create_appendix(tags)
+
+    @property
+    def source(self) -> str:
+        """Имя исходного файла (для оборудования из снимка - файла, по которому снимок построен)"""
+        if self.snapshot_meta is not None:
+            return self.snapshot_meta['source']
+        return self.xml.f_name
+
+    @property
+    def source_hash(self) -> str:
+        """Хэш содержимого исходного файла"""
+        if self.snapshot_meta is not None:
+            return self.snapshot_meta['file_hash']
+        return self.xml.file_hash
+
+    def export(self, path: str, export_format: str = 'parquet') -> str:
+        """Выгружает фактуры и результаты сравнения в папку path в формате parquet, feather или csv.
+        В описании выгрузки (manifest.json) сохраняются исходные файлы и их хэши.
+        Возвращает путь к описанию"""
+
+        # Невычисленные таблицы (без колонок) не выгружаются, пустой набор изменений выгружается
+        tables = {name: getattr(self, name) for name in self.export_tables if len(getattr(self, name).columns) > 0}
+
+        sources = [{'role': 'first', 'file': self.source, 'hash': self.source_hash}]
+        if self.compared_with is not None:
+            sources.append({'role': 'second', **self.compared_with})
+        meta = {
+            'equipment': type(self).__name__,
+            'parser_version': PARSER_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'sources': sources,
+        }
 
-    @staticmethod
-    def _left_join(left: pd.DataFrame,
-                   right: pd.DataFrame,
-                   left_on: str,
-                   right_on: str,
-                   suffixes: tuple[str, str] = ('_left', '_right')) -> pd.DataFrame:
-        """Метод-обертка для библиотечного метода merge. Нужен для обработки ошибок"""
-
-        try:
-            out_df = left.merge(right, left_on=left_on, right_on=right_on, how='left', suffixes=suffixes)
-        except ValueError:
-            log.error(f'Правая таблица не содержит записей или пустой ключ {right_on}')
-            out_df = left.copy()
-            out_df = out_df.reindex(columns=left.columns.tolist() + right.columns.tolist())
-        except Exception as e:
-            log.error(f'Ошибка при объединении двух таблиц {e}')
-            out_df = left.copy()
-
-        return out_df
+        return write_tables(path, tables, export_format, meta)
+
+    @classmethod
+    def load_export(cls, path: str) -> BaseEquipment:
+        """Восстанавливает фактуры и результаты сравнения из выгрузки export, например,
+        чтобы по ним сохранить xlsx (save_table). Файлы xml при этом не читаются"""
+
+        manifest = read_manifest(path)
+        if manifest['equipment'] != cls.__name__:
+            raise ValueError(f'Выгрузка {path} сделана для {manifest["equipment"]}, а не для {cls.__name__}')
+
+        source = manifest['sources'][0]
+        equipment = cls(None)
+        equipment.snapshot_meta = {'source': source['file'], 'file_hash': source['hash'],
+                                   'parser_version': manifest['parser_version'], 'created': manifest['created']}
+        if len(manifest['sources']) > 1:
+            second = manifest['sources'][1]
+            equipment.compared_with = {'file': second['file'], 'hash': second['hash']}
+
+        for name, df in read_tables(path).items():
+            setattr(equipment, name, df)
+
+        log.info(f'Выгрузка {cls.__name__} из {source["file"]} загружена из {path}')
+
+        return equipment
+
+    def save_snapshot(self, path: str) -> None:
+        """Сохраняет рассчитанные фактуры и отпечатки их строк в папку path (снимок эталона).
+        По снимку оборудование восстанавливается без повторного разбора xml, см. load_snapshot.
+        Прежний снимок в path заменяется, другую существующую папку path перезаписать нельзя (FileExistsError)"""
+
+        tables = {}
+        for name, compare_id in self.snapshot_tables.items():
+            df = getattr(self, name)
+            tables[name] = df.reset_index(drop=True)
+            if compare_id is not None:
+                tables[f'{name}_fingerprints'] = get_fingerprints(df, compare_id).reset_index()
+
+        meta = {
+            'equipment': type(self).__name__,
+            'source': self.source,
+            'file_hash': self.source_hash,
+            'parser_version': PARSER_VERSION,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        }
 
-    @staticmethod
-    def _get_dict_df():
-        """Возвращает df с тегами считанными из файлов-словарей"""
+        path = os.path.abspath(path)
+        # Потеря снимка эталона - ошибка, в отличие от кэша разбора
+        TableCache(os.path.dirname(path)).save(os.path.basename(path), tables, meta, strict=True)
+        log.info(f'Снимок {type(self).__name__} из {self.source} сохранен в {path}')
+
+    @classmethod
+    def load_snapshot(cls, path: str) -> BaseEquipment:
+        """Восстанавливает оборудование из снимка save_snapshot. Файл xml при этом не читается"""
+
+        path = os.path.abspath(path)
+        cache = TableCache(os.path.dirname(path))
+        meta = cache.load_meta(os.path.basename(path))
+        tables = cache.load(os.path.basename(path))
+        if meta is None or tables is None:
+            raise FileNotFoundError(f'Снимок {path} не найден')
+        if meta['equipment'] != cls.__name__:
+            raise ValueError(f'Снимок {path} сохранен для {meta["equipment"]}, а не для {cls.__name__}')
+        if meta['parser_version'] != PARSER_VERSION:
+            log.warning(f'Снимок {path} сохранен версией разборщика {meta["parser_version"]}')
+
+        # Исходный xml может быть уже недоступен, сведения о нем берутся из снимка
+        equipment = cls(None)
+        equipment.snapshot_meta = meta
+        for name, compare_id in cls.snapshot_tables.items():
+            setattr(equipment, name, tables[name])
+            if compare_id is not None:
+                equipment.fingerprints[name] = tables[f'{name}_fingerprints'].set_index(compare_id)['fingerprint']
+
+        log.info(f'Снимок {cls.__name__} из {meta["source"]} ({meta["created"]}) загружен из {path}')
+
+        return equipment
 
-        dicts_dict = {
-            r'dict\base_voltage.xml': ['BaseVoltage'],
-            r'dict\operational_limit_type.xml': ['OperationalLimitType'],
-            r'dict\database_ProductAssetModel.xml': ['Manufacturer', 'ProductAssetModel', 'Organisation']
-        }
+    @staticmethod
+    def _get_dict_df() -> MappingProxyType:
+        """Возвращает df с тегами считанными из файлов-словарей.
+        Каждый файл читается один раз на процесс и перечитывается, только если изменились его дата или размер.
+        Таблицы общие для всего оборудования: MappingProxyType защищает только набор таблиц, но не сами
+        таблицы, поэтому изменять их на месте нельзя. TagRegistry строит теги по копиям таблиц словарей"""
 
         out_dict = {}
-        for key, value in dicts_dict.items():
-            xml = XmlReader(key)
-            for val in value:
-                df = xml.get_data_by_tag(val)
-                out_dict[f'{val}_dict'] = df
+        for key, value in DICT_FILES.items():
+            stat = os.stat(key)
+            file_stamp = (stat.st_mtime_ns, stat.st_size)
+
+            cached = _dict_cache.get(key)
+            if cached is None or cached[0] != file_stamp:
+                log.info(f'Читаем словарь {key}')
+                xml = XmlReader(key)
+                tables = xml.get_data_by_list(value)
+                cached = _dict_cache[key] = (file_stamp, {f'{val}_dict': tables[val] for val in value})
+
+            out_dict.update(cached[1])
 
-        return out_dict
+        return MappingProxyType(out_dict)
+
+    @staticmethod
+    def get_dict_cache() -> dict:
+        """Словари, прочитанные в этом процессе (при необходимости читаются), для передачи в процессы разбора"""
+        BaseEquipment._get_dict_df()
+        return dict(_dict_cache)
+
+    @staticmethod
+    def set_dict_cache(cache: dict) -> None:
+        """Добавляет словари, прочитанные в другом процессе (см. get_dict_cache). Используется как инициализатор
+        процессов разбора: файлы словарей не перечитываются, пока не изменились их дата или размер"""
+        _dict_cache.update(cache)
 
     @abstractmethod
-    def _create_appendix(self, table_dict: dict[str: pd.DataFrame]) -> pd.DataFrame:
+    def _create_appendix(self, tags: TagRegistry) -> pd.DataFrame:
         pass
 
     @abstractmethod
@@ -84,221 +239,224 @@ class BaseEquipment(ABC):
 
 
 class Breaker(BaseEquipment):
+    snapshot_tables = {'appendix_1': 'breaker_mRID', 'appendix_2_1': 'currentlimit_mRID',
+                       'appendix_2_2': None, 'appendix_2_2_pivot': None}
 
-    def __init__(self, xml: XmlReader):
-        super().__init__(xml)
+    def __init__(self, xml: XmlReader, filtered: bool = False):
+        super().__init__(xml, filtered)
         self.mRID = 'breaker_mRID'
         self.tables_list = ['Breaker', 'BreakerInfo', 'Asset', 'OperationalLimitSet', 'CurrentLimit', 'VoltageLimit',
                             'Bay', 'VoltageLevel', 'Substation', 'Manufacturer', 'Organisation', 'ProductAssetModel',
                             'Terminal', 'TemperatureDependentLimitTable', 'TemperatureDependentLimitPoint'
                             ]
 
-    def _create_appendix(self, table_dict: dict[str: pd.DataFrame]) -> None:
+        # Связи выключателя для режима отбора. Manufacturer, Organisation и ProductAssetModel дополняются
+        # записями словарей, поэтому не отбираются
+        self.root_tag = 'Breaker'
+        self.links = [
+            Link('Breaker', 'Equipment.EquipmentContainer', 'Bay'),
+            Link('Bay', 'Bay.VoltageLevel', 'VoltageLevel'),
+            Link('VoltageLevel', 'VoltageLevel.Substation', 'Substation'),
+            Link('Breaker', 'PowerSystemResource.Assets', 'Asset'),
+            Link('Breaker', 'PowerSystemResource.AssetDatasheet', 'BreakerInfo'),
+            Link('Asset', 'Asset.AssetInfo', 'BreakerInfo'),
+            Link('Terminal', 'Terminal.ConductingEquipment', 'Breaker', reverse=True),
+            Link('OperationalLimitSet', 'OperationalLimitSet.Equipment', 'Breaker', reverse=True),
+            Link('CurrentLimit', 'OperationalLimit.OperationalLimitSet', 'OperationalLimitSet', reverse=True),
+            Link('VoltageLimit', 'OperationalLimit.OperationalLimitSet', 'OperationalLimitSet', reverse=True),
+            Link('CurrentLimit', 'OperationalLimit.LimitDependencyModel', 'TemperatureDependentLimitTable'),
+            Link('TemperatureDependentLimitPoint', 'TemperatureDependentLimitPoint.TemperatureDependentLimitTable',
+                 'TemperatureDependentLimitTable', reverse=True),
+        ]
+
+        # Колонки фактур, которые сравниваются и сохраняются в xlsx. Остальные колонки при сборке не вычисляются
+        self.breaker_columns = ['breaker_mRID', 'IdentifiedObject.name_br', 'Equipment.normallyInService',
+                                'ConductingEquipment.isThreePhaseEquipment', 'Switch.ratedCurrent',
+                                'ProtectedSwitch.breakingCapacity', 'Switch.normalOpen', 'Breaker.inTransitTime',
+                                'bay_mRID', 'IdentifiedObject.name_bay', 'voltagelevel_mRID',
+                                'IdentifiedObject.name_voltlev', 'substation_mRID', 'IdentifiedObject.name_subst',
+                                'asset_mRID', 'Asset.inUseDate', 'Asset.AssetInfo', 'IdentifiedObject.name_pam',
+                                'IdentifiedObject.name_org', 'breakerinfo_mRID', 'IdentifiedObject.name_br3',
+                                'SwitchInfo.ratedVoltage', 'SwitchInfo.ratedCurrent', 'SwitchInfo.breakingCapacity',
+                                'BreakerInfo.interruptingTime', 'BreakerInfo.ratedRecloseTime',
+                                'SwitchInfo.ratedInterruptingTime', 'SwitchInfo.ratedInTransitTime',
+                                'SwitchInfo.isSinglePhase', 'SwitchInfo.isUnganged', 'terminal_mRID_br4',
+                                'ACDCTerminal.sequenceNumber_br4', 'Terminal.ConnectivityNode_br4', 'terminal_mRID_T2',
+                                'ACDCTerminal.sequenceNumber_T2', 'Terminal.ConnectivityNode_T2']
+
+        self.voltage_limit_columns = ['voltagelimit_mRID', 'IdentifiedObject.name_voltlimit', 'VoltageLimit.value',
+                                      'operationallimittype_mRID', 'IdentifiedObject.name_olt',
+                                      'OperationalLimitType.acceptableDuration', 'operationallimitset_mRID',
+                                      'IdentifiedObject.name_OLSetV', 'OperationalLimitSet.Terminal', 'breaker_mRID',
+                                      'IdentifiedObject.name_br']
+
+    def _create_appendix(self, tags: TagRegistry) -> None:
         """Основной метод для расчета всех фактур"""
 
-        self._create_appendix_1(table_dict)
-
-        self._create_appendix_2_1(table_dict)
+        self._create_appendix_1(tags)
 
-        self._create_appendix_2_2(table_dict)
+        self._create_appendix_2_1(tags)
 
-    def _create_appendix_1(self, table_dict: dict[str: pd.DataFrame]) -> None:
+        self._create_appendix_2_2(tags)
 
-        # Словари считываем отдельно из xml
-        dicts_df = self._get_dict_df()
+    def _create_appendix_1(self, tags: TagRegistry) -> None:
 
-        base_voltage = BaseVoltageTag(dicts_df.get('BaseVoltage_dict'))
+        base_voltage = tags.get(BaseVoltageTag, 'BaseVoltage_dict')
 
-        breaker = BreakerTag(table_dict.get('Breaker'))
-        breaker_info = BreakerInfoTag(table_dict.get('BreakerInfo'))
-        asset = AssetTag(table_dict.get('Asset'))
+        breaker = tags.get(BreakerTag, 'Breaker')
+        breaker_info = tags.get(BreakerInfoTag, 'BreakerInfo')
+        asset = tags.get(AssetTag, 'Asset')
 
-        bay = BayTag(table_dict.get('Bay'))
-        voltage_level = VoltageLevelTag(table_dict.get('VoltageLevel'))
-        substation = SubstationTag(table_dict.get('Substation'))
-        terminal = TerminalTag(table_dict.get('Terminal'))
+        bay = tags.get(BayTag, 'Bay')
+        voltage_level = tags.get(VoltageLevelTag, 'VoltageLevel')
+        substation = tags.get(SubstationTag, 'Substation')
+        terminal = tags.get(TerminalTag, 'Terminal')
 
         # В этих тегах надо добавлять данные из словаря
-        manufacturer_df = table_dict.get('Manufacturer')
-        manufacturer_dict_df = dicts_df.get('Manufacturer_dict')
-        if len(manufacturer_df) == 0:
-            manufacturer_df = manufacturer_dict_df
-        else:
-            manufacturer_df = pd.concat([manufacturer_dict_df, manufacturer_df], axis=0, ignore_index=True)
-            manufacturer_df.drop_duplicates(subset=['manufacturer_mRID'], keep='first', inplace=True)
-        manufacturer = ManufacturerTag(manufacturer_df)
-
-        organisation_df = table_dict.get('Organisation')
-        organisation_dict_df = dicts_df.get('Organisation_dict')
-        if len(organisation_df) == 0:
-            organisation_df = organisation_dict_df
-        else:
-            organisation_df = pd.concat([organisation_dict_df, organisation_df], axis=0, ignore_index=True)
-            organisation_df.drop_duplicates(subset=['organisation_mRID'], keep='first', inplace=True)
-        organisation = OrganisationTag(organisation_df)
-
-        pam_df = table_dict.get('ProductAssetModel')
-        pam_dict_df = dicts_df.get('ProductAssetModel_dict')
-        if len(pam_df) == 0:
-            pam_df = pam_dict_df
-        else:
-            pam_df = pd.concat([pam_dict_df, pam_df], axis=0, ignore_index=True)
-            pam_df.drop_duplicates(subset=['productassetmodel_mRID'], keep='first', inplace=True)
-        product_asset_model = ProductAssetModelTag(pam_df)
-
-        log.info('Собираем первую фактуру')
-        out_df = self._left_join(breaker.data, bay.data,
-                                 left_on='Equipment.EquipmentContainer', right_on=bay.mRID, suffixes=('_br', '_bay'))
-        out_df = self._left_join(out_df, voltage_level.data,
-                                 left_on='Bay.VoltageLevel', right_on=voltage_level.mRID, suffixes=('_bay', '_voltlev'))
-        out_df = self._left_join(out_df, substation.data,
-                                 left_on='VoltageLevel.Substation', right_on=substation.mRID,
-                                 suffixes=('_voltlev', '_subst'))
-        out_df = self._left_join(out_df, base_voltage.data,
-                                 left_on='VoltageLevel.BaseVoltage', right_on=base_voltage.mRID,
-                                 suffixes=('_subst', '_base_v'))
-
-        out_df = self._left_join(out_df, asset.data,
-                                 left_on='PowerSystemResource.Assets', right_on=asset.mRID,
-                                 suffixes=('_base_v', '_asset'))
-        out_df = self._left_join(out_df, product_asset_model.data,
-                                 left_on='Asset.ProductAssetModel', right_on=product_asset_model.mRID,
-                                 suffixes=('_asset', '_pam'))
-        out_df = self._left_join(out_df, manufacturer.data,
-                                 left_on='ProductAssetModel.Manufacturer', right_on=manufacturer.mRID,
-                                 suffixes=('_pam', '_manufact'))
-        out_df = self._left_join(out_df, organisation.data,
-                                 left_on='OrganisationRole.Organisation', right_on=organisation.mRID,
-                                 suffixes=('_manufact', '_org'))
-
-        # Может быть заполнен или AssetDatasheet или AssetInfo
-        if (out_df['Asset.AssetInfo'].astype(str).str.strip().eq('EMPTY')).all():
-            out_df = self._left_join(out_df, breaker_info.data,
-                                     left_on='PowerSystemResource.AssetDatasheet', right_on=breaker_info.mRID,
-                                     suffixes=('_br2', '_info'))
-        else:
-            out_df = self._left_join(out_df, breaker_info.data,
-                                     left_on='Asset.AssetInfo', right_on=breaker_info.mRID, suffixes=('_br2', '_info'))
+        manufacturer = tags.get(ManufacturerTag, 'Manufacturer', 'Manufacturer_dict')
+        organisation = tags.get(OrganisationTag, 'Organisation', 'Organisation_dict')
+        product_asset_model = tags.get(ProductAssetModelTag, 'ProductAssetModel', 'ProductAssetModel_dict')
 
         # Порядок полюсов в файле может быть перепутан - указываем его явно
-        terminal_1 = terminal.data[terminal.data['ACDCTerminal.sequenceNumber'] == '1']
-        terminal_2 = terminal.data[terminal.data['ACDCTerminal.sequenceNumber'] == '2']
+        terminal_1 = terminal.data[terminal.data['ACDCTerminal.sequenceNumber'].isin(['1'])]
+        terminal_2 = terminal.data[terminal.data['ACDCTerminal.sequenceNumber'].isin(['2'])]
 
-        out_df = self._left_join(out_df, terminal_1,
-                                 left_on=breaker.mRID, right_on='Terminal.ConductingEquipment',
-                                 suffixes=('_br3', '_T1'))
-        out_df = self._left_join(out_df, terminal_2,
-                                 left_on=breaker.mRID, right_on='Terminal.ConductingEquipment',
-                                 suffixes=('_br4', '_T2'))
+        log.info('Собираем первую фактуру')
+        plan = JoinPlan(breaker.data, [
+            JoinStep(bay.data, 'Equipment.EquipmentContainer', bay.mRID, ('_br', '_bay')),
+            JoinStep(voltage_level.data, 'Bay.VoltageLevel', voltage_level.mRID, ('_bay', '_voltlev')),
+            JoinStep(substation.data, 'VoltageLevel.Substation', substation.mRID, ('_voltlev', '_subst')),
+            JoinStep(base_voltage.data, 'VoltageLevel.BaseVoltage', base_voltage.mRID, ('_subst', '_base_v')),
+
+            JoinStep(asset.data, 'PowerSystemResource.Assets', asset.mRID, ('_base_v', '_asset')),
+            JoinStep(product_asset_model.data, 'Asset.ProductAssetModel', product_asset_model.mRID,
+                     ('_asset', '_pam')),
+            JoinStep(manufacturer.data, 'ProductAssetModel.Manufacturer', manufacturer.mRID, ('_pam', '_manufact')),
+            JoinStep(organisation.data, 'OrganisationRole.Organisation', organisation.mRID, ('_manufact', '_org')),
+
+            # Может быть заполнен или AssetInfo или AssetDatasheet
+            JoinStep(breaker_info.data, ('Asset.AssetInfo', 'PowerSystemResource.AssetDatasheet'), breaker_info.mRID,
+                     ('_br2', '_info')),
+
+            JoinStep(terminal_1, breaker.mRID, 'Terminal.ConductingEquipment', ('_br3', '_T1')),
+            JoinStep(terminal_2, breaker.mRID, 'Terminal.ConductingEquipment', ('_br4', '_T2')),
+        ], columns=self.breaker_columns)
+        out_df = plan.run()
 
         self.appendix_1 = out_df.copy()
 
-    def _create_appendix_2_1(self, table_dict: dict[str: pd.DataFrame]) -> None:
-        # Словари считываем отдельно из xml
-        dicts_df = self._get_dict_df()
-
-        operational_limit_type = OperationalLimitTypeTag(dicts_df.get('OperationalLimitType_dict'))
+    def _create_appendix_2_1(self, tags: TagRegistry) -> None:
+        operational_limit_type = tags.get(OperationalLimitTypeTag, 'OperationalLimitType_dict')
 
-        breaker = BreakerTag(table_dict.get('Breaker'))
-        operational_limit_set = OperationalLimitSetTag(table_dict.get('OperationalLimitSet'))
+        breaker = tags.get(BreakerTag, 'Breaker')
+        operational_limit_set = tags.get(OperationalLimitSetTag, 'OperationalLimitSet')
 
-        current_limit = CurrentLimitTag(table_dict.get('CurrentLimit'))
+        current_limit = tags.get(CurrentLimitTag, 'CurrentLimit')
 
-        temperature_dependent_limit_table = TemperatureDependentLimitTableTag(
-            table_dict.get('TemperatureDependentLimitTable'))
-        temperature_dependent_limit_point = TemperatureDependentLimitPointTag(
-            table_dict.get('TemperatureDependentLimitPoint'))
+        temperature_dependent_limit_table = tags.get(TemperatureDependentLimitTableTag,
+                                                     'TemperatureDependentLimitTable')
+        temperature_dependent_limit_point = tags.get(TemperatureDependentLimitPointTag,
+                                                     'TemperatureDependentLimitPoint')
 
         log.info('Собираем вторую фактуру по CurrentLimit')
-        out_df = self._left_join(current_limit.data, operational_limit_type.data,
-                                 left_on='OperationalLimit.OperationalLimitType',
-                                 right_on=operational_limit_type.mRID,
-                                 suffixes=('_curlimit', '_olt'))
-        out_df = self._left_join(out_df, operational_limit_set.data,
-                                 left_on='OperationalLimit.OperationalLimitSet',
-                                 right_on=operational_limit_set.mRID,
-                                 suffixes=('_olt', '_OLSetI'))
-        out_df = self._left_join(out_df,
-                                 breaker.data[['breaker_mRID', 'IdentifiedObject.name', 'Switch.ratedCurrent']],
-                                 left_on='OperationalLimitSet.Equipment', right_on=breaker.mRID,
-                                 suffixes=('_OLSetI', '_br'))
-        out_df = self._left_join(out_df, temperature_dependent_limit_table.data,
-                                 left_on='OperationalLimit.LimitDependencyModel',
-                                 right_on=temperature_dependent_limit_table.mRID,
-                                 suffixes=('_curlimit2', '_Table'))
-        out_df = self._left_join(out_df, temperature_dependent_limit_point.data,
-                                 left_on=temperature_dependent_limit_table.mRID,
-                                 right_on=temperature_dependent_limit_point.mRID,
-                                 suffixes=('_Table', '_Point'))
+        plan = JoinPlan(current_limit.data, [
+            JoinStep(operational_limit_type.data, 'OperationalLimit.OperationalLimitType',
+                     operational_limit_type.mRID, ('_curlimit', '_olt')),
+            JoinStep(operational_limit_set.data, 'OperationalLimit.OperationalLimitSet',
+                     operational_limit_set.mRID, ('_olt', '_OLSetI')),
+            JoinStep(breaker.data[['breaker_mRID', 'IdentifiedObject.name', 'Switch.ratedCurrent']],
+                     'OperationalLimitSet.Equipment', breaker.mRID, ('_OLSetI', '_br')),
+            JoinStep(temperature_dependent_limit_table.data, 'OperationalLimit.LimitDependencyModel',
+                     temperature_dependent_limit_table.mRID, ('_curlimit2', '_Table')),
+            JoinStep(temperature_dependent_limit_point.data, temperature_dependent_limit_table.mRID,
+                     temperature_dependent_limit_point.mRID, ('_Table', '_Point')),
+        ])
+        out_df = plan.run()
 
         out_df.dropna(axis=0, subset=[breaker.mRID], inplace=True)
 
         self.appendix_2_1 = out_df.copy()
 
-    def _create_appendix_2_2(self, table_dict: dict[str: pd.DataFrame]) -> None:
-        dicts_df = self._get_dict_df()
+    def _create_appendix_2_2(self, tags: TagRegistry) -> None:
+        operational_limit_type = tags.get(OperationalLimitTypeTag, 'OperationalLimitType_dict')
 
-        operational_limit_type = OperationalLimitTypeTag(dicts_df.get('OperationalLimitType_dict'))
-
-        breaker = BreakerTag(table_dict.get('Breaker'))
-        operational_limit_set = OperationalLimitSetTag(table_dict.get('OperationalLimitSet'))
-        voltage_limit = VoltageLimitTag(table_dict.get('VoltageLimit'))
+        breaker = tags.get(BreakerTag, 'Breaker')
+        operational_limit_set = tags.get(OperationalLimitSetTag, 'OperationalLimitSet')
+        voltage_limit = tags.get(VoltageLimitTag, 'VoltageLimit')
 
         log.info('Собираем третью фактуру по VoltageLimit')
-        out_df = self._left_join(voltage_limit.data, operational_limit_type.data,
-                                 left_on='OperationalLimit.OperationalLimitType',
-                                 right_on=operational_limit_type.mRID,
-                                 suffixes=('_voltlimit', '_olt'))
-        out_df = self._left_join(out_df, operational_limit_set.data,
-                                 left_on='OperationalLimit.OperationalLimitSet',
-                                 right_on=operational_limit_set.mRID,
-                                 suffixes=('_olt', '_OLSetV'))
-        out_df = self._left_join(out_df, breaker.data[['breaker_mRID', 'IdentifiedObject.name']],
-                                 left_on='OperationalLimitSet.Equipment', right_on=breaker.mRID,
-                                 suffixes=('_OLSetV', '_br'))
+        plan = JoinPlan(voltage_limit.data, [
+            JoinStep(operational_limit_type.data, 'OperationalLimit.OperationalLimitType',
+                     operational_limit_type.mRID, ('_voltlimit', '_olt')),
+            JoinStep(operational_limit_set.data, 'OperationalLimit.OperationalLimitSet',
+                     operational_limit_set.mRID, ('_olt', '_OLSetV')),
+            JoinStep(breaker.data[['breaker_mRID', 'IdentifiedObject.name']],
+                     'OperationalLimitSet.Equipment', breaker.mRID, ('_OLSetV', '_br')),
+        ], columns=self.voltage_limit_columns)
+        out_df = plan.run()
 
         out_df.dropna(axis=0, subset=[breaker.mRID], inplace=True)
 
         log.info('Собираем свод по VoltageLimit')
-        out_df['IdentifiedObject.name_olt'] = out_df['IdentifiedObject.name_olt'].fillna('Unknown')
-        out_df_pivot = out_df.pivot_table(index=breaker.mRID,
-                                          columns='IdentifiedObject.name_olt',
-                                          values='VoltageLimit.value',
-                                          aggfunc='first').reset_index()
+        out_df['IdentifiedObject.name_olt'] = out_df['IdentifiedObject.name_olt'].astype(object).fillna('Unknown')
+        # mRID переводим в строки, чтобы свод был упорядочен по значению mRID, а не по коду категории
+        out_df_pivot = (out_df
+                        .astype({breaker.mRID: object})
+                        .pivot_table(index=breaker.mRID,
+                                     columns='IdentifiedObject.name_olt',
+                                     values='VoltageLimit.value',
+                                     aggfunc='first')
+                        .reset_index())
 
         self.appendix_2_2 = out_df.copy()
         self.appendix_2_2_pivot = out_df_pivot.copy()
 
     def compare(self, other: Breaker):
-        comparer_1 = Comparer(self.appendix_1, other.appendix_1, 'breaker_mRID')
-        comparer_2_1 = Comparer(self.appendix_2_1, other.appendix_2_1, 'currentlimit_mRID')
+        # Если other загружен из снимка, его отпечатки строк не пересчитываются
+        # Выключатели с несовпавшими mRID сопоставляются по подстанции, уровню напряжения, присоединению и имени
+        comparer_1 = Comparer(self.appendix_1, other.appendix_1, 'breaker_mRID',
+                              second_fingerprints=other.fingerprints.get('appendix_1'),
+                              match_keys=['IdentifiedObject.name_subst', 'IdentifiedObject.name_voltlev',
+                                          'IdentifiedObject.name_bay', 'IdentifiedObject.name_br'])
+        comparer_2_1 = Comparer(self.appendix_2_1, other.appendix_2_1, 'currentlimit_mRID',
+                                second_fingerprints=other.fingerprints.get('appendix_2_1'))
 
         # Проверяем наличие ParentObject. Запустить один раз.
-        comparer_1.check_xml(self.xml.xml_txt)
+        # У оборудования из снимка или выгрузки xml нет, проверяем тот файл, который есть
+        xml = self.xml if self.xml is not None else other.xml
+        if xml is not None:
+            comparer_1.check_xml(xml)
 
         log.info('Запуск сравнялки для главной фактуры')
         self.compare_1 = comparer_1.run()
         log.info('Запуск сравнялки для фактуры CurrentLimit')
         self.compare_2_1 = comparer_2_1.run()
 
+        self.changes_1 = comparer_1.changes
+        self.changes_2_1 = comparer_2_1.changes
+        self.compared_with = {'file': other.source, 'hash': other.source_hash}
+
+    @staticmethod
+    def compare_versions(versions: list[Breaker], names: list[str] = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """История изменений главной фактуры и фактуры CurrentLimit по ревизиям.
+        versions - рассчитанные (run или load_snapshot) версии по порядку ревизий, от ранней к поздней.
+        По умолчанию ревизии называются по именам исходных файлов"""
+
+        if names is None:
+            names = [os.path.basename(version.source) for version in versions]
+
+        log.info('Запуск сравнения версий главной фактуры')
+        history_1 = VersionComparer([version.appendix_1 for version in versions], 'breaker_mRID', names).run()
+        log.info('Запуск сравнения версий фактуры CurrentLimit')
+        history_2_1 = VersionComparer([version.appendix_2_1 for version in versions], 'currentlimit_mRID',
+                                      names).run()
+
+        return history_1, history_2_1
+
     def save_table(self, f_path: str = None) -> tuple[str, str]:
         """Сохраняем все рассчитанные таблицы в xlsx"""
 
         # В эксель сохраняем только нужные колонки
-        breaker_columns = ['breaker_mRID', 'IdentifiedObject.name_br', 'Equipment.normallyInService',
-                           'ConductingEquipment.isThreePhaseEquipment', 'Switch.ratedCurrent',
-                           'ProtectedSwitch.breakingCapacity', 'Switch.normalOpen', 'Breaker.inTransitTime',
-                           'bay_mRID', 'IdentifiedObject.name_bay', 'voltagelevel_mRID',
-                           'IdentifiedObject.name_voltlev', 'substation_mRID', 'IdentifiedObject.name_subst',
-                           'asset_mRID', 'Asset.inUseDate', 'Asset.AssetInfo', 'IdentifiedObject.name_pam',
-                           'IdentifiedObject.name_org', 'breakerinfo_mRID', 'IdentifiedObject.name_br3',
-                           'SwitchInfo.ratedVoltage', 'SwitchInfo.ratedCurrent', 'SwitchInfo.breakingCapacity',
-                           'BreakerInfo.interruptingTime', 'BreakerInfo.ratedRecloseTime',
-                           'SwitchInfo.ratedInterruptingTime', 'SwitchInfo.ratedInTransitTime',
-                           'SwitchInfo.isSinglePhase', 'SwitchInfo.isUnganged', 'terminal_mRID_br4',
-                           'ACDCTerminal.sequenceNumber_br4', 'Terminal.ConnectivityNode_br4', 'terminal_mRID_T2',
-                           'ACDCTerminal.sequenceNumber_T2', 'Terminal.ConnectivityNode_T2']
-
         current_limit_columns = ['currentlimit_mRID', 'IdentifiedObject.name_curlimit', 'CurrentLimit.value',
                                  'OperationalLimit.LimitDependencyModel', 'operationallimittype_mRID',
                                  'IdentifiedObject.name_olt', 'OperationalLimitType.acceptableDuration',
@@ -310,15 +468,9 @@ class Breaker(BaseEquipment):
         temperature_points = [col for col in self.compare_2_1.columns if re.fullmatch(r'^[-0-9.]+$', str(col))]
         current_limit_columns.extend(temperature_points)
 
-        voltage_limit_columns = ['voltagelimit_mRID', 'IdentifiedObject.name_voltlimit', 'VoltageLimit.value',
-                                 'operationallimittype_mRID', 'IdentifiedObject.name_olt',
-                                 'OperationalLimitType.acceptableDuration', 'operationallimitset_mRID',
-                                 'IdentifiedObject.name_OLSetV', 'OperationalLimitSet.Terminal', 'breaker_mRID',
-                                 'IdentifiedObject.name_br']
-
-        dfc1 = self.compare_1[breaker_columns].copy()
+        dfc1 = self.compare_1[self.breaker_columns].copy()
         dfc2_1 = self.compare_2_1[current_limit_columns].copy()
-        dfc2_2 = self.appendix_2_2[voltage_limit_columns].copy()
+        dfc2_2 = self.appendix_2_2[self.voltage_limit_columns].copy()
         dfc2_2_pivot = self.appendix_2_2_pivot.copy()
 
         dfc1['Дата получения'] = pd.Timestamp.today()
@@ -337,13 +489,6 @@ class Breaker(BaseEquipment):
         excel_name_long = f'{f_path}\\Breakers_long_{file_date}.xlsx'
         excel_name_short = f'{f_path}\\Breakers_short_{file_date}.xlsx'
 
-        log.info('Сохраняем полную версию фактуры')
-        with pd.ExcelWriter(excel_name_long) as writer:
-            dfc1.to_excel(writer, sheet_name='breaker', index=False, )
-            dfc2_1.to_excel(writer, sheet_name='current_limit', index=False, )
-            dfc2_2.to_excel(writer, sheet_name='voltage_limit_full', index=False, )
-
-        log.info('Сохраняем краткую версию фактуры')
         breaker_columns_short = ['IdentifiedObject.name_br', 'Equipment.normallyInService',
                                  'ConductingEquipment.isThreePhaseEquipment', 'Switch.ratedCurrent',
                                  'ProtectedSwitch.breakingCapacity', 'Switch.normalOpen', 'Breaker.inTransitTime',
@@ -356,10 +501,19 @@ class Breaker(BaseEquipment):
                                  'SwitchInfo.ratedInterruptingTime', 'SwitchInfo.ratedInTransitTime',
                                  'SwitchInfo.isSinglePhase', 'SwitchInfo.isUnganged']
 
-        with pd.ExcelWriter(excel_name_short) as writer:
-            dfc1[breaker_columns_short].to_excel(writer, sheet_name='breaker', index=False, )
-            dfc2_1.to_excel(writer, sheet_name='current_limit', index=False, )
-            dfc2_2_pivot.to_excel(writer, sheet_name='voltage_limit', index=False, )
+        # Краткий лист выключателей - часть колонок полного. Строки листов преобразуются блоками при записи
+        sheet_breaker = Sheet(dfc1)
+        sheet_current_limit = Sheet(dfc2_1)
+
+        log.info('Сохраняем полную и краткую версии фактуры')
+        write_workbooks({
+            excel_name_long: {'breaker': sheet_breaker,
+                              'current_limit': sheet_current_limit,
+                              'voltage_limit_full': Sheet(dfc2_2)},
+            excel_name_short: {'breaker': sheet_breaker.select(breaker_columns_short),
+                               'current_limit': sheet_current_limit,
+                               'voltage_limit': Sheet(dfc2_2_pivot)},
+        })
 
         return excel_name_long, excel_name_short
 
@@ -371,7 +525,7 @@ class PowerTransformer(BaseEquipment):
         self.mRID = ''
         self.tables_list = []
 
-    def _create_appendix(self, table_dict: dict[str: pd.DataFrame]) -> pd.DataFrame:
+    def _create_appendix(self, tags: TagRegistry) -> pd.DataFrame:
         pass
 
     def compare(self, other: PowerTransformer):
@@ -388,7 +542,7 @@ class CurrentTransformer(BaseEquipment):
         self.mRID = ''
         self.tables_list = []
 
-    def _create_appendix(self, table_dict: dict[str: pd.DataFrame]) -> pd.DataFrame:
+    def _create_appendix(self, tags: TagRegistry) -> pd.DataFrame:
         pass
 
     def compare(self, other: CurrentTransformer):
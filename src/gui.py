@@ -1,14 +1,21 @@
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from time import strftime, localtime
 
 from tkinter import *
 import tkinter.ttk as ttk
 import tkinter.font as tkfont
 
-from equipments import Breaker, PowerTransformer, CurrentTransformer
+from equipments import BaseEquipment, Breaker, PowerTransformer, CurrentTransformer
+from tools.cache import TableCache, user_cache_dir
 from xml_reader import XmlReader
 
+# Папка для кэша разобранных xml в профиле пользователя и ее наибольший размер.
+# После обработки давно не использовавшиеся наборы таблиц удаляются
+CACHE_DIR = user_cache_dir('xParser')
+CACHE_MAX_SIZE = 2 * 1024 ** 3
+
 status_dict = {
     0:  'Успешное завершение',
     -999: 'Неуспешное завершение',
@@ -30,19 +37,25 @@ class Color:
 
 
 class Model:
+    @staticmethod
+    def _run_equipment(equipment: BaseEquipment) -> BaseEquipment:
+        """Разбор оборудования в отдельном процессе. Возвращает оборудование с рассчитанными таблицами"""
+        equipment.run()
+        return equipment
+
     @staticmethod
     def file_processing(current_equipment: str, fname_owner: str, fname_so: str,
-                        fpath_save: str = None) -> int | tuple[str, str]:
+                        fpath_save: str = None, parallel: bool = True) -> int | tuple[str, str]:
 
         # Читаем xml
         try:
-            xml_owner = XmlReader(fname_owner)
+            xml_owner = XmlReader(fname_owner, cache_dir=CACHE_DIR)
         except Exception as e:
             print(e)
             return -1
 
         try:
-            xml_so = XmlReader(fname_so)
+            xml_so = XmlReader(fname_so, cache_dir=CACHE_DIR)
         except Exception as e:
             print(e)
             return -2
@@ -63,15 +76,27 @@ class Model:
             return -4
 
         try:
-            # Запуск разбора
-            equipment_owner.run()
-            equipment_so.run()
+            # Запуск разбора. Файлы собственника и СО независимы до сравнения,
+            # поэтому в параллельном режиме на нескольких ядрах разбираются в двух процессах.
+            # Словари читаются один раз и передаются процессам
+            if parallel and (os.cpu_count() or 1) > 1:
+                with ProcessPoolExecutor(max_workers=2, initializer=BaseEquipment.set_dict_cache,
+                                         initargs=(BaseEquipment.get_dict_cache(),)) as executor:
+                    future_owner = executor.submit(Model._run_equipment, equipment_owner)
+                    future_so = executor.submit(Model._run_equipment, equipment_so)
+                    equipment_owner = future_owner.result()
+                    equipment_so = future_so.result()
+            else:
+                equipment_owner.run()
+                equipment_so.run()
 
             # Сравниваем оборуование
             equipment_owner.compare(equipment_so)
 
             # Сохраняем приложения
             fname_long, fname_short = equipment_owner.save_table(fpath_save)
+
+            TableCache(CACHE_DIR).prune(CACHE_MAX_SIZE)
         except Exception as e:
             print(e)
             return -5
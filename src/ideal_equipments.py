@@ -1,12 +1,18 @@
 import pandas as pd
 import numpy as np
 
+from tools.dtypes import EMPTY, compact_frame, is_compact
+
 
 class BaseTag:
+    # Колонки тега. По ним же из xml извлекаются только нужные дочерние теги
+    columns = []
+
     def __init__(self, df: pd.DataFrame):
         self.data = df
-        self.columns = []
         self.mRID = None
+        # В компактных таблицах пропуски остаются NA, в обычных заполняются строкой EMPTY
+        self.compact = is_compact(df)
 
     def check_structure(self) -> None:
         """Проверяет, что все нужные колонки есть в df.
@@ -17,7 +23,7 @@ class BaseTag:
         # Проверка, что все нужные тэги есть в xml
         for column in self.columns:
             if column not in df.columns:
-                df[column] = 'EMPTY'
+                df[column] = pd.NA if self.compact else EMPTY
 
         # Задаем количество и порядок колонок как в списке
         self.data = df[self.columns]
@@ -26,35 +32,97 @@ class BaseTag:
             self.data = pd.concat([self.data, pd.DataFrame([[np.nan] * self.data.shape[1]], columns=self.data.columns)],
                                   ignore_index=True)
 
-        self.data = self.data.fillna(value='EMPTY')
+        if not self.compact:
+            self.data = self.data.fillna(value=EMPTY)
+
+
+class TagRegistry:
+    """Нормализованные таблицы тегов одного разбора.
+    Каждый *Tag создается один раз и используется всеми фактурами и всем оборудованием.
+    Таблицы тегов общие, изменять их нельзя"""
+
+    def __init__(self, tables: dict[str: pd.DataFrame]):
+        # Исходные таблицы из xml и словарей
+        self.tables = dict(tables)
+        # Таблицы словарей общие для всех разборов процесса, теги строятся по их копиям
+        self._dict_names = set(tables)
+        self._tags = {}
+
+    def add_tables(self, tables: dict[str: pd.DataFrame]) -> None:
+        """Добавляет исходные таблицы, которых еще нет в реестре"""
+        for name, df in tables.items():
+            self.tables.setdefault(name, df)
+
+    def get(self, tag_class: type[BaseTag], table_name: str, dict_name: str = None) -> BaseTag:
+        """Возвращает тег, построенный по таблице table_name.
+        Если задан dict_name, то к записям из xml добавляются записи словаря (словарь в приоритете)"""
+
+        key = (tag_class, table_name, dict_name)
+        tag = self._tags.get(key)
+        if tag is None:
+            df = self._get_table(table_name)
+            if dict_name is not None:
+                dict_df = self._get_table(dict_name)
+                # Словари читаются в обычном виде, к компактной таблице добавляем их в компактном
+                if is_compact(df):
+                    dict_df = compact_frame(dict_df)
+                df = self._concat_dict(df, dict_df, f'{table_name.lower()}_mRID')
+            tag = self._tags[key] = tag_class(df)
+
+        return tag
+
+    def _get_table(self, table_name: str) -> pd.DataFrame | None:
+        """Исходная таблица для построения тега. Таблица словаря копируется,
+        чтобы изменения данных тега не попали в кэш словарей"""
+
+        df = self.tables.get(table_name)
+        if df is not None and table_name in self._dict_names:
+            df = df.copy()
+        return df
+
+    @staticmethod
+    def _concat_dict(df: pd.DataFrame, dict_df: pd.DataFrame, mrid: str) -> pd.DataFrame:
+        """Объединяет таблицу из xml с таблицей словаря"""
+        if len(df) == 0:
+            return dict_df
+
+        compact = is_compact(df)
+        df = pd.concat([dict_df, df], axis=0, ignore_index=True)
+        df.drop_duplicates(subset=[mrid], keep='first', inplace=True)
+        df.attrs['compact'] = compact
+
+        return df
 
 
 class BaseVoltageTag(BaseTag):
+    columns = ['basevoltage_mRID', 'name', 'nominalVoltage', 'isDC']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['basevoltage_mRID', 'name', 'nominalVoltage', 'isDC']
         self.mRID = self.columns[0]
 
 
 class OperationalLimitTypeTag(BaseTag):
+    columns = ['operationallimittype_mRID', 'IdentifiedObject.name', 'OperationalLimitType.acceptableDuration']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['operationallimittype_mRID', 'IdentifiedObject.name', 'OperationalLimitType.acceptableDuration']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class BreakerTag(BaseTag):
+    columns = ['breaker_mRID', 'IdentifiedObject.name', 'Equipment.EquipmentContainer',
+               'PowerSystemResource.Assets', 'PowerSystemResource.AssetDatasheet',
+               'ConductingEquipment.BaseVoltage', 'Equipment.normallyInService',
+               'ConductingEquipment.isThreePhaseEquipment',
+               'Switch.ratedCurrent', 'ProtectedSwitch.breakingCapacity',
+               'Switch.normalOpen', 'Breaker.inTransitTime', 'Switch.differenceInTransitTime',
+               ]
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['breaker_mRID', 'IdentifiedObject.name', 'Equipment.EquipmentContainer',
-                        'PowerSystemResource.Assets', 'PowerSystemResource.AssetDatasheet',
-                        'ConductingEquipment.BaseVoltage', 'Equipment.normallyInService',
-                        'ConductingEquipment.isThreePhaseEquipment',
-                        'Switch.ratedCurrent', 'ProtectedSwitch.breakingCapacity',
-                        'Switch.normalOpen', 'Breaker.inTransitTime', 'Switch.differenceInTransitTime',
-                        ]
         self.mRID = self.columns[0]
 
         self.check_structure()
@@ -62,28 +130,31 @@ class BreakerTag(BaseTag):
 
 # Group 1
 class BayTag(BaseTag):
+    columns = ['bay_mRID', 'IdentifiedObject.name', 'Bay.VoltageLevel']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['bay_mRID', 'IdentifiedObject.name', 'Bay.VoltageLevel']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class VoltageLevelTag(BaseTag):
+    columns = ['voltagelevel_mRID', 'VoltageLevel.BaseVoltage', 'IdentifiedObject.name',
+               'VoltageLevel.Substation']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['voltagelevel_mRID', 'VoltageLevel.BaseVoltage', 'IdentifiedObject.name',
-                        'VoltageLevel.Substation']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class SubstationTag(BaseTag):
+    columns = ['substation_mRID', 'IdentifiedObject.name', 'Substation.Region']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['substation_mRID', 'IdentifiedObject.name', 'Substation.Region']
         self.mRID = self.columns[0]
 
         self.check_structure()
@@ -91,49 +162,54 @@ class SubstationTag(BaseTag):
 
 # Group 2
 class AssetTag(BaseTag):
+    columns = ['asset_mRID', 'IdentifiedObject.name', 'Asset.ProductAssetModel', 'Asset.inUseDate',
+               'Asset.AssetInfo']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['asset_mRID', 'IdentifiedObject.name', 'Asset.ProductAssetModel', 'Asset.inUseDate',
-                        'Asset.AssetInfo']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class ProductAssetModelTag(BaseTag):
+    columns = ['productassetmodel_mRID', 'IdentifiedObject.name', 'ProductAssetModel.Manufacturer']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['productassetmodel_mRID', 'IdentifiedObject.name', 'ProductAssetModel.Manufacturer']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class ManufacturerTag(BaseTag):
+    columns = ['manufacturer_mRID', 'IdentifiedObject.name', 'OrganisationRole.Organisation']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['manufacturer_mRID', 'IdentifiedObject.name', 'OrganisationRole.Organisation']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class OrganisationTag(BaseTag):
+    columns = ['organisation_mRID', 'IdentifiedObject.name']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['organisation_mRID', 'IdentifiedObject.name']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class BreakerInfoTag(BaseTag):
+    columns = ['breakerinfo_mRID', 'IdentifiedObject.name', 'SwitchInfo.ratedVoltage',
+               'SwitchInfo.ratedCurrent', 'SwitchInfo.breakingCapacity', 'BreakerInfo.interruptingTime',
+               'BreakerInfo.ratedRecloseTime', 'SwitchInfo.ratedInterruptingTime',
+               'SwitchInfo.ratedInTransitTime', 'SwitchInfo.isSinglePhase', 'SwitchInfo.isUnganged']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['breakerinfo_mRID', 'IdentifiedObject.name', 'SwitchInfo.ratedVoltage',
-                        'SwitchInfo.ratedCurrent', 'SwitchInfo.breakingCapacity', 'BreakerInfo.interruptingTime',
-                        'BreakerInfo.ratedRecloseTime', 'SwitchInfo.ratedInterruptingTime',
-                        'SwitchInfo.ratedInTransitTime', 'SwitchInfo.isSinglePhase', 'SwitchInfo.isUnganged']
         self.mRID = self.columns[0]
 
         self.check_structure()
@@ -141,10 +217,11 @@ class BreakerInfoTag(BaseTag):
 
 # Group 3
 class TerminalTag(BaseTag):
+    columns = ['terminal_mRID', 'ACDCTerminal.sequenceNumber', 'IdentifiedObject.name',
+               'Terminal.ConductingEquipment', 'Terminal.ConnectivityNode']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['terminal_mRID', 'ACDCTerminal.sequenceNumber', 'IdentifiedObject.name',
-                        'Terminal.ConductingEquipment', 'Terminal.ConnectivityNode']
         self.mRID = self.columns[0]
 
         self.check_structure()
@@ -152,51 +229,56 @@ class TerminalTag(BaseTag):
 
 # Group 4
 class OperationalLimitSetTag(BaseTag):
+    columns = ['operationallimitset_mRID', 'IdentifiedObject.name', 'OperationalLimitSet.Terminal',
+               'OperationalLimitSet.Equipment']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['operationallimitset_mRID', 'IdentifiedObject.name', 'OperationalLimitSet.Terminal',
-                        'OperationalLimitSet.Equipment']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class VoltageLimitTag(BaseTag):
+    columns = ['voltagelimit_mRID', 'OperationalLimit.OperationalLimitSet', 'IdentifiedObject.name',
+               'VoltageLimit.value', 'OperationalLimit.OperationalLimitType']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['voltagelimit_mRID', 'OperationalLimit.OperationalLimitSet', 'IdentifiedObject.name',
-                        'VoltageLimit.value', 'OperationalLimit.OperationalLimitType']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class CurrentLimitTag(BaseTag):
+    columns = ['currentlimit_mRID', 'OperationalLimit.OperationalLimitSet', 'IdentifiedObject.name',
+               'CurrentLimit.value', 'OperationalLimit.OperationalLimitType',
+               'OperationalLimit.LimitDependencyModel']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['currentlimit_mRID', 'OperationalLimit.OperationalLimitSet', 'IdentifiedObject.name',
-                        'CurrentLimit.value', 'OperationalLimit.OperationalLimitType',
-                        'OperationalLimit.LimitDependencyModel']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class TemperatureDependentLimitTableTag(BaseTag):
+    columns = ['temperaturedependentlimittable_mRID', 'IdentifiedObject.name']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['temperaturedependentlimittable_mRID', 'IdentifiedObject.name']
         self.mRID = self.columns[0]
 
         self.check_structure()
 
 
 class TemperatureDependentLimitPointTag(BaseTag):
+    columns = ['temperaturedependentlimitpoint_mRID', 'TemperatureDependentLimitPoint.temperature',
+               'TemperatureDependentLimitPoint.limitPercent',
+               'TemperatureDependentLimitPoint.TemperatureDependentLimitTable']
+
     def __init__(self, df: pd.DataFrame):
         super().__init__(df)
-        self.columns = ['temperaturedependentlimitpoint_mRID', 'TemperatureDependentLimitPoint.temperature',
-                        'TemperatureDependentLimitPoint.limitPercent',
-                        'TemperatureDependentLimitPoint.TemperatureDependentLimitTable']
         self.mRID = self.columns[0]
 
         self.check_structure()
@@ -204,7 +286,7 @@ class TemperatureDependentLimitPointTag(BaseTag):
 
     def reformat_table(self):
         self.data['TemperatureDependentLimitPoint.temperature'] = \
-            self.data['TemperatureDependentLimitPoint.temperature'].replace({'EMPTY': 0})
+            self.data['TemperatureDependentLimitPoint.temperature'].replace({EMPTY: 0}).fillna(0)
 
         self.data['TemperatureDependentLimitPoint.temperature'] = \
             self.data['TemperatureDependentLimitPoint.temperature'].astype(float)
@@ -212,10 +294,37 @@ class TemperatureDependentLimitPointTag(BaseTag):
         result = self.data.pivot_table(index='TemperatureDependentLimitPoint.TemperatureDependentLimitTable',
                                        columns='TemperatureDependentLimitPoint.temperature',
                                        values='TemperatureDependentLimitPoint.limitPercent',
-                                       aggfunc='first').reset_index()
+                                       aggfunc='first', observed=True).reset_index()
         result.columns.name = None
         result.columns = [str(col) for col in result.columns]
 
         self.columns = result.columns
         self.data = result
         self.mRID = 'TemperatureDependentLimitPoint.TemperatureDependentLimitTable'
+
+
+# Теги, которые строятся по таблицам xml: имя таблицы -> класс тега
+TAG_CLASSES = {
+    'Breaker': BreakerTag,
+    'BreakerInfo': BreakerInfoTag,
+    'Asset': AssetTag,
+    'OperationalLimitSet': OperationalLimitSetTag,
+    'CurrentLimit': CurrentLimitTag,
+    'VoltageLimit': VoltageLimitTag,
+    'Bay': BayTag,
+    'VoltageLevel': VoltageLevelTag,
+    'Substation': SubstationTag,
+    'Manufacturer': ManufacturerTag,
+    'Organisation': OrganisationTag,
+    'ProductAssetModel': ProductAssetModelTag,
+    'Terminal': TerminalTag,
+    'TemperatureDependentLimitTable': TemperatureDependentLimitTableTag,
+    'TemperatureDependentLimitPoint': TemperatureDependentLimitPointTag,
+}
+
+
+def get_schema(table_names: list[str]) -> dict[str: list[str]]:
+    """Колонки, которые нужно извлечь из xml для каждой таблицы.
+    Для таблиц без класса тега схема не задается, они извлекаются целиком"""
+
+    return {name: TAG_CLASSES[name].columns for name in table_names if name in TAG_CLASSES}
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from tools.dtypes import EMPTY
+from tools.logger import log
+
+
+class JoinStep:
+    """Ребро графа соединений: к текущей таблице слева присоединяется таблица right по ключу left_on -> right_on.
+    Если left_on задан списком, используется первый заполненный ключ (не все значения EMPTY)"""
+
+    def __init__(self, right: pd.DataFrame, left_on: str | tuple[str, ...], right_on: str,
+                 suffixes: tuple[str, str] = ('_left', '_right')):
+        self.right = right
+        self.left_on = (left_on,) if isinstance(left_on, str) else tuple(left_on)
+        self.right_on = right_on
+        self.suffixes = suffixes
+
+
+class JoinPlan:
+    """Цепочка левых соединений таблиц по mRID.
+
+    Имена колонок получаются такими же, как при последовательных вызовах merge с суффиксами,
+    но соединение выполняется поиском позиций по индексу ключа правой таблицы, а колонки
+    собираются в DataFrame один раз в конце. Если задан columns, то из таблиц берутся
+    только колонки, которые попадут в результат или нужны как ключи соединения.
+    Категориальные ключи (mRID одной модели) сравниваются по целочисленным кодам"""
+
+    def __init__(self, base: pd.DataFrame, steps: list[JoinStep], columns: list[str] = None):
+        self.base = base
+        self.steps = steps
+        self.columns = columns
+
+        # Колонка идентифицируется номером, имя колонки меняется при добавлении суффиксов
+        self._names = []
+        # Номера колонок исходной таблицы и колонок, добавленных каждым шагом
+        self._base_ids = []
+        self._step_ids = []
+        # Для каждого шага: номера колонок - кандидатов в ключ соединения
+        self._key_ids = []
+        # Для каждого шага: переименование колонок (номер -> новое имя)
+        self._renames = []
+
+        self._simulate()
+
+    def _new_column(self, name: str) -> int:
+        self._names.append(name)
+        return len(self._names) - 1
+
+    def _simulate(self) -> None:
+        """Рассчитывает имена колонок после каждого шага, не выполняя соединения"""
+
+        current = [self._new_column(name) for name in self.base.columns]
+        self._base_ids = list(current)
+        names = {self._names[col_id]: col_id for col_id in current}
+
+        for step in self.steps:
+            missing = [key for key in step.left_on if key not in names]
+            if missing or step.right_on not in step.right.columns:
+                raise KeyError(f'Нет ключа соединения {missing or step.right_on}')
+            self._key_ids.append([names[key] for key in step.left_on])
+
+            # Как в merge: совпадающие имена получают суффиксы в обеих таблицах
+            overlap = set(names) & set(step.right.columns)
+            rename = {names[name]: f'{name}{step.suffixes[0]}' for name in overlap}
+            self._renames.append(rename)
+            for col_id, new_name in rename.items():
+                self._names[col_id] = new_name
+
+            right_ids = [self._new_column(f'{name}{step.suffixes[1]}' if name in overlap else name)
+                         for name in step.right.columns]
+            self._step_ids.append(right_ids)
+
+            current += right_ids
+            names = {self._names[col_id]: col_id for col_id in current}
+            if len(names) != len(current):
+                raise ValueError(f'Суффиксы {step.suffixes} приводят к повторяющимся колонкам')
+
+        self._result_ids = current
+
+    def _get_needed(self) -> set[int]:
+        """Номера колонок, которые надо вычислять"""
+
+        if self.columns is None:
+            return set(self._result_ids)
+
+        final_names = {self._names[col_id]: col_id for col_id in self._result_ids}
+        unknown = [name for name in self.columns if name not in final_names]
+        if unknown:
+            log.warning(f'В результате соединения нет колонок {unknown}')
+
+        needed = {final_names[name] for name in self.columns if name in final_names}
+        for key_ids in self._key_ids:
+            needed.update(key_ids)
+
+        return needed
+
+    def run(self) -> pd.DataFrame:
+        """Выполняет соединения. Возвращает итоговую таблицу"""
+
+        needed = self._get_needed()
+
+        data = {col_id: self.base[name].array
+                for col_id, name in zip(self._base_ids, self.base.columns) if col_id in needed}
+        size = len(self.base)
+
+        for step, key_ids, right_ids in zip(self.steps, self._key_ids, self._step_ids):
+            left_key = data[self._choose_key(data, key_ids)]
+            right_key = step.right[step.right_on]
+
+            left_pos, right_pos = get_left_indexer(left_key, right_key)
+            if left_pos is not None:
+                # Строки левой таблицы размножились (в правой таблице повторяется ключ)
+                data = {col_id: values[left_pos] for col_id, values in data.items()}
+                size = len(left_pos)
+
+            right_columns = [name for col_id, name in zip(right_ids, step.right.columns) if col_id in needed]
+            right_part = step.right[right_columns].reset_index(drop=True).reindex(right_pos)
+            for col_id, name in zip(right_ids, step.right.columns):
+                if col_id in needed:
+                    data[col_id] = right_part[name].array
+
+        result_ids = [col_id for col_id in self._result_ids if col_id in needed]
+        if self.columns is not None:
+            keep = set(self.columns)
+            result_ids = [col_id for col_id in result_ids if self._names[col_id] in keep]
+
+        return pd.DataFrame({self._names[col_id]: data[col_id] for col_id in result_ids},
+                            index=pd.RangeIndex(size))
+
+    @staticmethod
+    def _choose_key(data: dict[int: pd.api.extensions.ExtensionArray | np.ndarray], key_ids: list[int]) -> int:
+        """Из нескольких ключей выбирает первый, в котором не все значения EMPTY или пропуски"""
+
+        for col_id in key_ids[:-1]:
+            values = pd.Series(data[col_id])
+            if not (values.isna() | values.astype(str).str.strip().eq(EMPTY)).all():
+                return col_id
+
+        return key_ids[-1]
+
+
+def get_left_indexer(left_key, right_key: pd.Series) -> tuple[np.ndarray | None, np.ndarray]:
+    """Возвращает позиции строк для левого соединения.
+    Первое значение - позиции строк левой таблицы (None, если строки не размножаются),
+    второе - позиции строк правой таблицы (-1, если пары нет)"""
+
+    left_key, right_key = _get_key_values(left_key, right_key.array)
+
+    right_index = pd.Index(right_key)
+    if right_index.is_unique:
+        return None, right_index.get_indexer(left_key)
+
+    # Ключ в правой таблице повторяется: позиции рассчитываем через merge только по ключам
+    positions = pd.DataFrame({'key': left_key, 'left_pos': np.arange(len(left_key))}).merge(
+        pd.DataFrame({'key': right_key, 'right_pos': np.arange(len(right_key))}),
+        on='key', how='left')
+
+    return positions['left_pos'].to_numpy(), positions['right_pos'].fillna(-1).astype(int).to_numpy()
+
+
+def _get_key_values(left_key, right_key) -> tuple[np.ndarray, np.ndarray]:
+    """Приводит ключи к сравнимому виду: коды, если категории общие, иначе строки.
+    Пропуски (код -1) соединяются между собой, как NaN в merge"""
+
+    left_dtype = getattr(left_key, 'dtype', None)
+    right_dtype = getattr(right_key, 'dtype', None)
+    if isinstance(left_dtype, pd.CategoricalDtype) and isinstance(right_dtype, pd.CategoricalDtype) and \
+            (left_dtype is right_dtype or left_dtype.categories.equals(right_dtype.categories)):
+        return left_key.codes, right_key.codes
+
+    return np.asarray(left_key, dtype=object), np.asarray(right_key, dtype=object)
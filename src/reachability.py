@@ -0,0 +1,96 @@
+import pandas as pd
+
+from xml_reader import XmlReader
+from tools.logger import log
+
+
+class Link:
+    """Ссылка объектов таблицы table на объекты таблицы target через колонку column.
+    Обычная ссылка отбирает объекты target, на которые ссылаются отобранные объекты table.
+    Обратная (reverse) - объекты table, которые ссылаются на отобранные объекты target"""
+
+    def __init__(self, table: str, column: str, target: str, reverse: bool = False):
+        self.table = table
+        self.column = column
+        self.target = target
+        self.reverse = reverse
+
+
+def get_reachable_tables(xml: XmlReader, tag_list: list[str], schema: dict[str: list[str]],
+                         root_tag: str, links: list[Link]) -> dict[str: pd.DataFrame]:
+    """Извлекает таблицы tag_list и оставляет в таблицах из links только объекты,
+    связанные по ссылкам с объектами root_tag. Таблицы извлекаются за один проход по xml
+    (или берутся из кэша), отбор идет по колонкам ссылок готовых таблиц.
+    Колонки ссылок, которых нет в schema, извлекаются только для отбора и затем удаляются"""
+
+    link_schema = {tag: list(columns) for tag, columns in schema.items()}
+    for link in links:
+        columns = link_schema.get(link.table)
+        if columns is not None and link.column not in columns:
+            columns.append(link.column)
+
+    tables = xml.get_data_by_list(tag_list, link_schema)
+    reached = find_reachable(tables, root_tag, links)
+
+    for tag, mrids in reached.items():
+        df = tables[tag]
+        mrid_column = f'{tag.lower()}_mRID'
+        # В пустой таблице колонок нет
+        if mrid_column not in df:
+            continue
+
+        keep = df[mrid_column].isin(mrids).to_numpy()
+        log.info(f'Отобрано {tag}: {keep.sum()} из {len(df)}')
+        if not keep.all():
+            df = df[keep].reset_index(drop=True)
+
+        extra_columns = [column for column in link_schema.get(tag, []) if column not in schema[tag] and column in df]
+        tables[tag] = df.drop(columns=extra_columns)
+
+    return tables
+
+
+def find_reachable(tables: dict[str: pd.DataFrame], root_tag: str, links: list[Link]) -> dict[str: set[str]]:
+    """По ссылкам links от всех объектов root_tag находит связанные объекты.
+    Возвращает tag: множество mRID для root_tag и всех таблиц из links"""
+
+    tag_names = {root_tag} | {link.table for link in links} | {link.target for link in links}
+    reached = {tag: set() for tag in tag_names}
+    reached[root_tag] = get_values(tables[root_tag], f'{root_tag.lower()}_mRID')
+
+    # Проходим по ссылкам, пока находятся новые объекты. Множества только растут, поэтому ссылка,
+    # у источника которой не изменился размер множества, повторно не проверяется
+    checked = {}
+    changed = True
+    while changed:
+        changed = False
+        for i, link in enumerate(links):
+            df = tables[link.table]
+            mrid_column = f'{link.table.lower()}_mRID'
+            source_size = len(reached[link.target if link.reverse else link.table])
+            if link.column not in df or mrid_column not in df or checked.get(i) == source_size:
+                continue
+            checked[i] = source_size
+
+            if link.reverse:
+                found = get_values(df, mrid_column, df[link.column].isin(reached[link.target]))
+                updated = reached[link.table]
+            else:
+                found = get_values(df, link.column, df[mrid_column].isin(reached[link.table]))
+                updated = reached[link.target]
+
+            if not found <= updated:
+                updated |= found
+                changed = True
+
+    return reached
+
+
+def get_values(df: pd.DataFrame, column: str, mask: pd.Series = None) -> set[str]:
+    """Множество значений колонки (строк mRID) в строках mask без пропусков"""
+
+    if column not in df:
+        return set()
+
+    values = df[column] if mask is None else df.loc[mask, column]
+    return set(values.dropna().unique())
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from tools.logger import log
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+# Размер блока при расчете хэша файла
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_hash(f_name: str) -> str:
+    """Возвращает хэш содержимого файла"""
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(f_name, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def user_cache_dir(app_name: str) -> str:
+    """Папка кэша приложения в профиле пользователя: %LOCALAPPDATA%\\app_name\\cache в Windows,
+    иначе $XDG_CACHE_HOME/app_name или ~/.cache/app_name"""
+
+    local_app_data = os.environ.get('LOCALAPPDATA')
+    if local_app_data:
+        return os.path.join(local_app_data, app_name, 'cache')
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, app_name)
+
+
+class TableCache:
+    """Кэш таблиц tag: pd.DataFrame на диске.
+    Каждый набор таблиц хранится в отдельной папке, одна таблица - один файл.
+    Если установлен pyarrow, таблицы сохраняются в feather, иначе в pickle.
+    Категориальные колонки (mRID) сохраняются кодами, а общий для них набор категорий - один раз"""
+
+    manifest_name = 'tables.json'
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.extension = 'feather' if pyarrow is not None else 'pkl'
+
+    @staticmethod
+    def get_key(content_hash: str, tag_list: list[str], version: str, schema: dict[str: list[str]] = None) -> str:
+        """Ключ кэша: хэш содержимого файла, набор тегов, версия разборщика и набор извлекаемых колонок"""
+
+        key_txt = '|'.join([content_hash, version, *sorted(set(tag_list))])
+        if schema:
+            key_txt += '|' + json.dumps({tag: sorted(columns) for tag, columns in schema.items()}, sort_keys=True)
+        return hashlib.blake2b(key_txt.encode(), digest_size=20).hexdigest()
+
+    def load(self, key: str) -> dict[str: pd.DataFrame] | None:
+        """Возвращает таблицы из кэша или None, если в кэше их нет"""
+
+        path = os.path.join(self.cache_dir, key)
+        manifest = os.path.join(path, self.manifest_name)
+        if not os.path.isfile(manifest):
+            return None
+
+        try:
+            with open(manifest, 'r', encoding='utf-8') as file:
+                manifest_dict = json.load(file)
+
+            dtypes = []
+            for f_name in manifest_dict['categories']:
+                categories = self._read_table(os.path.join(path, f_name))['category'].to_numpy()
+                dtypes.append(pd.CategoricalDtype(categories=categories))
+
+            out_dict = {}
+            for tag, f_name in manifest_dict['tables'].items():
+                df = self._read_table(os.path.join(path, f_name))
+                for column, dtype_id in manifest_dict['categorical'][tag].items():
+                    df[column] = pd.Categorical.from_codes(df[column], dtype=dtypes[dtype_id])
+                out_dict[tag] = df
+        except Exception as e:
+            log.warning(f'Не удалось прочитать кэш {path}: {e}')
+            return None
+
+        log.info(f'Таблицы загружены из кэша {path}')
+
+        # Время изменения описания - время последнего использования набора (см. prune)
+        try:
+            os.utime(manifest)
+        except OSError:
+            pass
+
+        return out_dict
+
+    def load_meta(self, key: str) -> dict | None:
+        """Возвращает сохраненные вместе с таблицами сведения или None, если в кэше их нет"""
+
+        manifest = os.path.join(self.cache_dir, key, self.manifest_name)
+        if not os.path.isfile(manifest):
+            return None
+
+        with open(manifest, 'r', encoding='utf-8') as file:
+            return json.load(file).get('meta')
+
+    def save(self, key: str, tables: dict[str: pd.DataFrame], meta: dict = None, strict: bool = False) -> None:
+        """Сохраняет таблицы в кэш. Ошибки записи не прерывают работу, если не задан strict.
+        meta - дополнительные сведения (json), сохраняются в описании набора таблиц"""
+
+        path = os.path.join(self.cache_dir, key)
+        # Пишем во временную папку и переименовываем, чтобы не оставить неполный кэш
+        tmp_path = f'{path}.tmp{os.getpid()}'
+
+        try:
+            # Заменяется только прежний набор таблиц: чужая папка (без описания tables.json) не удаляется
+            if os.path.exists(path) and not os.path.isfile(os.path.join(path, self.manifest_name)):
+                raise FileExistsError(f'Папка {path} существует и не является набором таблиц кэша')
+
+            os.makedirs(tmp_path, exist_ok=True)
+
+            manifest_dict = {'tables': {}, 'categories': [], 'categorical': {}, 'meta': meta}
+            dtypes = []
+            for tag, df in tables.items():
+                # Категориальные колонки заменяем кодами
+                categorical = {}
+                df = df.copy(deep=False)
+                for column in df.columns:
+                    if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                        continue
+                    dtype = df[column].dtype
+                    # pandas создает отдельный экземпляр типа для каждой колонки, поэтому общий словарь mRID
+                    # находим по совпадению категорий (для колонок одной модели это один и тот же индекс)
+                    dtype_id = next((i for i, known in enumerate(dtypes)
+                                     if known.categories.equals(dtype.categories)), None)
+                    if dtype_id is None:
+                        dtype_id = len(dtypes)
+                        dtypes.append(dtype)
+                    categorical[column] = dtype_id
+                    df[column] = df[column].cat.codes
+
+                f_name = f'{tag}.{self.extension}'
+                self._write_table(df, os.path.join(tmp_path, f_name))
+                manifest_dict['tables'][tag] = f_name
+                manifest_dict['categorical'][tag] = categorical
+
+            for dtype_id, dtype in enumerate(dtypes):
+                f_name = f'categories_{dtype_id}.{self.extension}'
+                self._write_table(pd.DataFrame({'category': dtype.categories}), os.path.join(tmp_path, f_name))
+                manifest_dict['categories'].append(f_name)
+
+            with open(os.path.join(tmp_path, self.manifest_name), 'w', encoding='utf-8') as file:
+                json.dump(manifest_dict, file, ensure_ascii=False)
+
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+            log.info(f'Таблицы сохранены в кэш {path}')
+        except Exception as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if strict:
+                raise
+            log.warning(f'Не удалось сохранить кэш {path}: {e}')
+
+    def prune(self, max_size: int) -> None:
+        """Удаляет давно не использовавшиеся наборы таблиц, пока размер кэша больше max_size байт.
+        Учитываются только наборы таблиц разбора: снимки (наборы со сведениями meta) и чужие папки не удаляются"""
+
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            manifest = os.path.join(entry.path, self.manifest_name)
+            if not entry.is_dir() or not os.path.isfile(manifest):
+                continue
+            try:
+                with open(manifest, 'r', encoding='utf-8') as file:
+                    if json.load(file).get('meta') is not None:
+                        continue
+                size = sum(item.stat().st_size for item in os.scandir(entry.path) if item.is_file())
+                entries.append((os.path.getmtime(manifest), size, entry.path))
+            except (OSError, ValueError) as e:
+                log.warning(f'Не удалось прочитать кэш {entry.path}: {e}')
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            log.info(f'Из кэша удален набор таблиц {path}')
+
+    def _write_table(self, df: pd.DataFrame, f_name: str) -> None:
+        if self.extension == 'feather':
+            df.to_feather(f_name)
+        else:
+            df.to_pickle(f_name)
+
+    def _read_table(self, f_name: str) -> pd.DataFrame:
+        if f_name.endswith('.feather'):
+            df = pd.read_feather(f_name)
+            # Пропуски в строковых колонках feather возвращает как None, приводим к NaN как при разборе xml
+            # Строки pandas (компактные таблицы) возвращаются с хранением в python, возвращаем в pyarrow
+            for column in df.columns:
+                if df[column].dtype == object:
+                    df[column] = df[column].where(df[column].notna(), float('nan'))
+                elif isinstance(df[column].dtype, pd.StringDtype):
+                    df[column] = df[column].astype(pd.StringDtype('pyarrow'))
+            return df
+
+        return pd.read_pickle(f_name)
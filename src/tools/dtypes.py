@@ -0,0 +1,95 @@
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+# Заполнитель пропусков в обычном (строковом) представлении таблиц
+EMPTY = 'EMPTY'
+
+# Строки храним в pyarrow, если он установлен
+STRING_DTYPE = pd.StringDtype('pyarrow' if pyarrow is not None else 'python')
+
+# Колонка становится категориальной, если уникальных значений не больше этой доли от числа строк
+CATEGORY_RATIO = 0.5
+
+# Числовые значения. Остальные колонки остаются строками, даже если похожи на числа
+# (например, ACDCTerminal.sequenceNumber сравнивается со строкой).
+# По этому же списку comparer.NUMERIC_TOLERANCES сравнивает значения как числа с допуском
+NUMERIC_COLUMNS = frozenset([
+    'nominalVoltage',
+    'OperationalLimitType.acceptableDuration',
+    'Switch.ratedCurrent', 'ProtectedSwitch.breakingCapacity',
+    'Breaker.inTransitTime', 'Switch.differenceInTransitTime',
+    'SwitchInfo.ratedVoltage', 'SwitchInfo.ratedCurrent', 'SwitchInfo.breakingCapacity',
+    'BreakerInfo.interruptingTime', 'BreakerInfo.ratedRecloseTime',
+    'SwitchInfo.ratedInterruptingTime', 'SwitchInfo.ratedInTransitTime',
+    'VoltageLimit.value', 'CurrentLimit.value',
+    'TemperatureDependentLimitPoint.temperature', 'TemperatureDependentLimitPoint.limitPercent',
+])
+
+BOOLEAN_VALUES = {'true': True, 'false': False}
+
+
+def compact_frame(df: pd.DataFrame, numeric_columns: frozenset[str] = NUMERIC_COLUMNS) -> pd.DataFrame:
+    """Переводит строковые колонки таблицы в компактные типы:
+    числа - в Int64/Float64, true/false - в boolean, повторяющиеся значения - в category,
+    остальное - в строковый тип pandas. Пропуски остаются пропусками (NA).
+    Категориальные колонки (mRID) не меняются"""
+
+    data = {column: compact_series(df[column], column in numeric_columns) for column in df.columns}
+    out_df = pd.DataFrame(data, index=df.index)
+    out_df.attrs['compact'] = True
+
+    return out_df
+
+
+def compact_series(series: pd.Series, numeric: bool = False) -> pd.Series:
+    """Компактный тип одной колонки"""
+
+    if series.dtype != object:
+        return series
+
+    values = series.dropna()
+
+    if numeric and len(values) > 0:
+        numbers = pd.to_numeric(values, errors='coerce')
+        # Если хоть одно значение не число, колонка остается строковой
+        if numbers.notna().all():
+            dtype = 'Int64' if pd.api.types.is_integer_dtype(numbers) else 'Float64'
+            return pd.to_numeric(series, errors='coerce').astype(dtype)
+
+    unique = values.unique()
+    if len(unique) > 0 and all(value in BOOLEAN_VALUES for value in unique):
+        return series.map(BOOLEAN_VALUES).astype('boolean')
+
+    if len(unique) <= len(series) * CATEGORY_RATIO:
+        return series.astype('category')
+
+    return series.astype(STRING_DTYPE)
+
+
+def is_compact(df: pd.DataFrame) -> bool:
+    """Таблица в компактном представлении (пропуски - NA, а не EMPTY)"""
+    return bool(df.attrs.get('compact', False))
+
+
+def to_text(series: pd.Series) -> pd.Series:
+    """Значения колонки компактного типа строками, как в исходном xml. Пропуски заменяются на EMPTY"""
+
+    # Обычные колонки numpy и категориальные (mRID) не меняются
+    if not isinstance(series.dtype, pd.api.extensions.ExtensionDtype) or isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+
+    if pd.api.types.is_bool_dtype(series.dtype):
+        text = series.map({True: 'true', False: 'false'}, na_action='ignore')
+    elif pd.api.types.is_float_dtype(series.dtype):
+        # Целые значения выводим без дробной части, чтобы 630 и 630.0 совпадали
+        text = series.astype(object).map(lambda value: str(int(value)) if value.is_integer() else str(value),
+                                         na_action='ignore')
+    else:
+        text = series.astype(object).map(str, na_action='ignore')
+
+    return text.astype(object).where(series.notna(), EMPTY)
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from tools.logger import log
+
+# Строки листа преобразуются в значения python блоками, в памяти только один блок
+CHUNK_SIZE = 10000
+
+
+class Sheet:
+    """Лист xlsx: таблица и колонки, которые в него записываются.
+    Строки не хранятся, а преобразуются в значения python блоками во время записи"""
+
+    def __init__(self, df: pd.DataFrame, columns: list[str] = None):
+        self.df = df
+        self.header = list(df.columns) if columns is None else list(columns)
+
+    def select(self, columns: list[str]) -> 'Sheet':
+        """Лист из части колонок той же таблицы, таблица не копируется"""
+
+        return Sheet(self.df, columns)
+
+    def iter_rows(self):
+        """Строки листа. Пропуски (NaN, NA) записываются пустыми ячейками, как в pd.DataFrame.to_excel"""
+
+        for start in range(0, len(self.df), CHUNK_SIZE):
+            chunk = self.df.iloc[start:start + CHUNK_SIZE][self.header]
+            values = chunk.astype(object).where(chunk.notna(), None)
+            yield from values.itertuples(index=False, name=None)
+
+
+def write_workbook(f_name: str, sheets: dict[str: Sheet]) -> str:
+    """Записывает листы в xlsx потоково (write_only): строки не хранятся в памяти книги openpyxl"""
+
+    book = Workbook(write_only=True)
+    # Оформление заголовка как у pd.DataFrame.to_excel
+    side = Side(style='thin')
+    font = Font(bold=True)
+    border = Border(left=side, right=side, top=side, bottom=side)
+    alignment = Alignment(horizontal='center', vertical='top')
+
+    for sheet_name, sheet in sheets.items():
+        worksheet = book.create_sheet(sheet_name)
+
+        header = []
+        for value in sheet.header:
+            cell = WriteOnlyCell(worksheet, value=value)
+            cell.font = font
+            cell.border = border
+            cell.alignment = alignment
+            header.append(cell)
+        worksheet.append(header)
+
+        for row in sheet.iter_rows():
+            worksheet.append(row)
+
+    book.save(f_name)
+    log.info(f'Сохранен файл {f_name}')
+
+    return f_name
+
+
+def write_workbooks(books: dict[str: dict[str: Sheet]], parallel: bool = True) -> list[str]:
+    """Записывает несколько книг xlsx: имя файла -> листы.
+    Запись ячеек openpyxl выполняется на python и держит GIL, поэтому при parallel и нескольких ядрах
+    книги записываются в отдельных процессах. Таблицы листов передаются процессам копированием"""
+
+    workers = min(len(books), os.cpu_count() or 1)
+    if not parallel or workers < 2:
+        return [write_workbook(f_name, sheets) for f_name, sheets in books.items()]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_workbook, f_name, sheets) for f_name, sheets in books.items()]
+        return [future.result() for future in futures]
@@ -0,0 +1,153 @@
+import json
+import os
+
+import pandas as pd
+
+from tools.cache import file_hash
+from tools.logger import log
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+# Форматы выгрузки: формат -> расширение файла
+EXPORT_FORMATS = {'parquet': 'parquet', 'feather': 'feather', 'csv': 'csv'}
+
+MANIFEST_NAME = 'manifest.json'
+
+# Пропуск в csv. Пустая строка - значение, а не пропуск
+CSV_NA = r'\N'
+
+
+def write_tables(path: str, tables: dict[str: pd.DataFrame], export_format: str = 'parquet',
+                 meta: dict = None) -> str:
+    """Выгружает таблицы в папку path, одна таблица - один файл формата export_format.
+    В папку записывается описание manifest.json: сведения meta (например, исходные файлы и их хэши),
+    файлы таблиц, число строк, колонки и хэши файлов. Возвращает путь к описанию"""
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Неизвестный формат выгрузки {export_format}, доступны: {list(EXPORT_FORMATS)}')
+    if export_format != 'csv' and pyarrow is None:
+        raise ValueError(f'Для выгрузки в {export_format} нужен pyarrow')
+
+    os.makedirs(path, exist_ok=True)
+
+    manifest = dict(meta or {})
+    manifest['format'] = export_format
+    manifest['tables'] = {}
+    for name, df in tables.items():
+        f_name = f'{name}.{EXPORT_FORMATS[export_format]}'
+        f_path = os.path.join(path, f_name)
+        df = _prepare_table(df)
+        _write_table(df, f_path, export_format)
+        # Типы колонок нужны, чтобы восстановить таблицу из csv без угадывания типов
+        manifest['tables'][name] = {'file': f_name, 'rows': len(df),
+                                    'columns': list(df.columns),
+                                    'dtypes': {column: _get_dtype_name(df[column].dtype) for column in df.columns},
+                                    'hash': file_hash(f_path)}
+
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+    log.info(f'Таблицы {list(tables)} выгружены в {path} ({export_format})')
+
+    return manifest_path
+
+
+def read_manifest(path: str) -> dict:
+    """Описание выгрузки из папки path"""
+
+    with open(os.path.join(path, MANIFEST_NAME), 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def read_tables(path: str) -> dict[str: pd.DataFrame]:
+    """Читает таблицы выгрузки write_tables. Если файл таблицы изменился после выгрузки, пишется предупреждение"""
+
+    manifest = read_manifest(path)
+
+    tables = {}
+    for name, table in manifest['tables'].items():
+        f_path = os.path.join(path, table['file'])
+        if file_hash(f_path) != table['hash']:
+            log.warning(f'Файл {f_path} изменен после выгрузки')
+        tables[name] = _read_table(f_path, manifest['format'], table['dtypes'])
+
+    return tables
+
+
+def _prepare_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Колоночные форматы требуют строковых имен колонок, индекса по умолчанию
+    и одного типа значений в колонке. Текстовые колонки со смешанными значениями приводятся к строкам.
+    Из категориальных колонок (mRID) убираются неиспользуемые категории словаря модели"""
+
+    df = df.reset_index(drop=True)
+    df.columns = [str(column) for column in df.columns]
+
+    for column in df.columns:
+        if df[column].dtype == object:
+            values = df[column]
+            df[column] = values.where(values.isna(), values.astype(str))
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.remove_unused_categories()
+
+    return df
+
+
+def _write_table(df: pd.DataFrame, f_name: str, export_format: str) -> None:
+    if export_format == 'parquet':
+        df.to_parquet(f_name, index=False)
+    elif export_format == 'feather':
+        df.to_feather(f_name)
+    else:
+        df.to_csv(f_name, index=False, encoding='utf-8', na_rep=CSV_NA)
+
+
+def _read_table(f_name: str, export_format: str, dtypes: dict[str: str]) -> pd.DataFrame:
+    if export_format in ('parquet', 'feather'):
+        df = pd.read_parquet(f_name) if export_format == 'parquet' else pd.read_feather(f_name)
+        # Пропуски в текстовых колонках pyarrow возвращает как None, приводим к NaN как в исходных таблицах.
+        # Пустая категориальная колонка читается как текстовая, а строки pandas - с хранением в python,
+        # таким колонкам возвращаем тип из описания
+        for column in df.columns:
+            if dtypes[column] != 'object' and _get_dtype_name(df[column].dtype) != dtypes[column]:
+                df[column] = df[column].astype(pd.api.types.pandas_dtype(dtypes[column]))
+            elif df[column].dtype == object:
+                df[column] = df[column].where(df[column].notna(), float('nan'))
+        return df
+
+    # Значения csv читаются строками как записаны, затем колонкам возвращаются исходные типы
+    df = pd.read_csv(f_name, encoding='utf-8', dtype=str, keep_default_na=False, na_values=[CSV_NA])
+    for column, dtype in dtypes.items():
+        df[column] = _restore_dtype(df[column], dtype)
+
+    return df
+
+
+def _get_dtype_name(dtype) -> str:
+    """Имя типа колонки, по которому тип восстанавливается (pd.api.types.pandas_dtype)"""
+
+    if isinstance(dtype, pd.StringDtype):
+        return f'string[{dtype.storage}]'
+    return str(dtype)
+
+
+def _restore_dtype(series: pd.Series, dtype: str) -> pd.Series:
+    """Колонка строк csv в исходном типе"""
+
+    if dtype == 'object':
+        return series.astype(object)
+    if dtype == 'category':
+        return series.astype('category')
+    if dtype in ('bool', 'boolean'):
+        return series.map({'True': True, 'False': False}).astype(dtype)
+
+    pandas_dtype = pd.api.types.pandas_dtype(dtype)
+    if pd.api.types.is_datetime64_any_dtype(pandas_dtype):
+        return pd.to_datetime(series).astype(pandas_dtype)
+    if pd.api.types.is_numeric_dtype(pandas_dtype):
+        return pd.to_numeric(series).astype(pandas_dtype)
+    return series.astype(pandas_dtype)
@@ -1,76 +1,346 @@
+import codecs
+import mmap
+import os
 import re
 import sys
+from typing import Iterator
 
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
 
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+from tools.cache import TableCache, file_hash
+from tools.dtypes import compact_frame
 from tools.logger import log
 
 
-class XmlReader:
+# Размер блока при потоковом чтении файла
+CHUNK_SIZE = 1024 * 1024
 
-    def __init__(self, f_name: str):
-        self.f_name = f_name
-        # Читаем xml из файла
-        self.xml_txt = self._read_file()
-        # Регистрируем пространства имен
-        self.namespaces = self._get_namespace()
-        # Парсим XML
-        self.root = self._get_root()
+# Размер блока для чтения начала файла (объявление xml и корневой тег)
+PROLOG_SIZE = 64 * 1024
 
-    def _read_file(self) -> str:
-        """Читает текстовый файл с автоматическим определенитем кодировки.
-        Возвращает текст из файла."""
+# Метки порядка байтов и соответствующие им кодировки
+BOMS = (
+    (codecs.BOM_UTF8, 'UTF-8'),
+    (codecs.BOM_UTF16_LE, 'UTF-16LE'),
+    (codecs.BOM_UTF16_BE, 'UTF-16BE'),
+)
 
-        log.info(f'Читаем xml-файл {self.f_name}')
-        # # Определяем кодировку файла
-        # with open(self.f_name, 'rb') as file:
-        #     raw = file.read(32)
-        #     encoding = chardet.detect(raw)['encoding']
-        # log.info(f'Кодировка файла {encoding}')
+# Кодировка из объявления <?xml ... encoding="..."?>
+DECLARATION_RE = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+# Корневой тег: имя и атрибуты (объявление xml, комментарии и DOCTYPE пропускаются)
+ROOT_TAG_RE = re.compile(r'<([A-Za-z_][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+# Объявление пространства имен xmlns:prefix="uri" или xmlns="uri"
+NAMESPACE_RE = re.compile(r'xmlns(?::([^\s=]+))?\s*=\s*["\']([^"\']*)["\']')
 
-        encoding = 'UTF-8-SIG'
+# Версия разборщика. Увеличивается при изменении состава или формата извлекаемых таблиц,
+# чтобы не использовать устаревший кэш
+PARSER_VERSION = '2'
+
+# Номер повторяющегося тега в имени колонки: tag_2, tag_3 ...
+DUPLICATE_RE = re.compile(r'_\d+$')
+
+# Глубоко вложенные значения. Для тега задается путь по вложенным тегам до элемента со значением
+NESTED_PATHS = {
+    'Asset.inUseDate': ('InUseDate', 'InUseDate.inUseDate'),
+}
+
+
+class EtreeBackend:
+    """Разбор xml стандартной библиотекой xml.etree.ElementTree"""
+
+    name = 'etree'
+
+    @staticmethod
+    def parser(encoding: str) -> ET.XMLParser:
+        return ET.XMLParser(encoding=encoding)
+
+    @staticmethod
+    def pull_parser(root_name: str) -> ET.XMLPullParser:
+        # Отбора событий по тегу нет, события start приходят для всех элементов
+        return ET.XMLPullParser(events=('start',))
+
+
+class LxmlBackend:
+    """Разбор xml библиотекой lxml. Снимаем ограничения на размер документа (huge_tree),
+    комментарии и инструкции обработки отбрасываем, как это делает ElementTree"""
+
+    name = 'lxml'
+
+    @staticmethod
+    def parser(encoding: str):
+        return lxml_etree.XMLParser(encoding=encoding, huge_tree=True, remove_comments=True, remove_pis=True)
+
+    @staticmethod
+    def pull_parser(root_name: str):
+        # Событие start нужно только для корня, остальные элементы отсеиваются без перехода в python
+        return lxml_etree.XMLPullParser(events=('start',), tag=f'{{*}}{root_name}', huge_tree=True,
+                                        remove_comments=True, remove_pis=True)
+
+
+BACKENDS = {
+    EtreeBackend.name: EtreeBackend,
+    LxmlBackend.name: LxmlBackend,
+}
+
+
+def get_backend(name: str = None) -> type[EtreeBackend] | type[LxmlBackend]:
+    """Возвращает разборщик xml по имени. По умолчанию используется lxml, если он установлен"""
+
+    if name is None:
+        name = LxmlBackend.name if lxml_etree is not None else EtreeBackend.name
+
+    if name not in BACKENDS:
+        raise ValueError(f'Неизвестный разборщик xml {name}. Доступны: {list(BACKENDS)}')
+
+    if name == LxmlBackend.name and lxml_etree is None:
+        log.warning('Библиотека lxml не установлена, используется xml.etree.ElementTree')
+        name = EtreeBackend.name
+
+    return BACKENDS[name]
+
+
+class MridDictionary:
+    """Словарь mRID одной модели: строка mRID -> целочисленный код.
+    Колонки с mRID хранятся как pd.Categorical с общими для всех таблиц модели категориями,
+    поэтому соединения и сравнения идут по целым кодам, а строки нужны только для вывода"""
+
+    # Заполнитель пропусков должен быть среди категорий, иначе не сработает fillna('EMPTY')
+    empty = 'EMPTY'
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self.encode(self.empty)
+
+    def encode(self, mrid: str) -> int:
+        """Возвращает код mRID, новый mRID добавляется в словарь"""
+        code = self.codes.get(mrid)
+        if code is None:
+            code = self.codes[mrid] = len(self.values)
+            self.values.append(mrid)
+        return code
+
+    def get_dtype(self) -> pd.CategoricalDtype:
+        """Тип колонок mRID для текущего состава словаря"""
+        return pd.CategoricalDtype(categories=self.values)
 
-        try:
-            with open(self.f_name, "r", encoding=encoding) as file:
-                content = file.read()
-            log.info(f'Файл успешно прочитан')
-        except FileNotFoundError:
-            log.error(f"Файл {self.f_name} не найден")
-            raise FileNotFoundError
-        except Exception as e:
-            log.error(f"Произошла ошибка: {e}")
-            sys.exit(-1)
 
-        return content
+class TableBuilder:
+    """Накапливает данные одной таблицы по столбцам.
+    Каждая колонка - список значений, недостающие ячейки заполняются NaN.
+    Если задан словарь mRID, то ссылки на объекты хранятся кодами из словаря.
+    Если задан список колонок, то остальные дочерние теги не сохраняются"""
 
-    def _get_namespace(self) -> dict[str: str]:
-        """Возвращает список всех namespace из xml файла"""
-        namespaces = {}
+    def __init__(self, mrids: MridDictionary = None, columns: list[str] = None):
+        self.columns = {}
+        self.size = 0
+        # Счетчик повторяющихся тегов в текущей строке
+        self.counters = {}
 
-        # Шаблон для поиска xmlns:prefix="uri"
-        pattern = r'xmlns:([^=]+)="([^"]+)"'
+        # Нужные колонки и теги, из которых они получаются (без номера повтора _2, _3 ...)
+        self.wanted_columns = set(columns) if columns is not None else None
+        self.wanted_tags = {DUPLICATE_RE.sub('', column) for column in columns} | set(columns) \
+            if columns is not None else None
 
-        # Находим все совпадения
-        matches = re.findall(pattern, self.xml_txt)
+        self.mrids = mrids
+        # Колонки, в которые записывались ссылки и обычные значения
+        self.ref_columns = set()
+        self.text_columns = set()
 
-        for prefix, uri in matches:
-            namespaces[prefix] = uri
+    def add_row(self) -> None:
+        """Начинает новую строку таблицы"""
+        self.size += 1
+        self.counters = {}
 
-        # Также ищем default namespace (без префикса)
-        default_pattern = r'xmlns="([^"]+)"'
-        default_matches = re.findall(default_pattern, self.xml_txt)
+    def get_name(self, tag_name: str) -> str:
+        """Возвращает имя колонки для тега текущей строки.
+        Повторяющиеся теги нумеруются: tag, tag_2, tag_3 ..."""
+        count = self.counters.get(tag_name, 0) + 1
+        self.counters[tag_name] = count
 
-        if default_matches:
-            namespaces[''] = default_matches[0]  # Пустая строка для default
+        if count == 1:
+            return tag_name
+        return f'{tag_name}_{count}'
 
-        return namespaces
+    def is_wanted_tag(self, tag_name: str) -> bool:
+        """Нужен ли дочерний тег хотя бы для одной колонки"""
+        return self.wanted_tags is None or tag_name in self.wanted_tags
+
+    def is_wanted(self, column: str) -> bool:
+        """Нужна ли колонка"""
+        return self.wanted_columns is None or column in self.wanted_columns
+
+    def set(self, column: str, value: str) -> None:
+        """Записывает значение в колонку текущей строки"""
+        self.text_columns.add(column)
+        self._set(column, value)
+
+    def set_ref(self, column: str, mrid: str) -> None:
+        """Записывает в колонку текущей строки ссылку на объект (mRID)"""
+        if self.mrids is None:
+            self.set(column, mrid)
+            return
+
+        self.ref_columns.add(column)
+        self._set(column, self.mrids.encode(mrid))
+
+    def _set(self, column: str, value: str | int) -> None:
+        values = self.columns.get(column)
+        if values is None:
+            values = self.columns[column] = []
+
+        if len(values) == self.size:
+            # Значение в этой строке уже было - перезаписываем
+            values[-1] = value
+        else:
+            values.extend([np.nan] * (self.size - 1 - len(values)))
+            values.append(value)
+
+    def to_frame(self, mrid_dtype: pd.CategoricalDtype = None) -> pd.DataFrame:
+        """Собирает DataFrame из накопленных колонок.
+        Колонки, в которых были только ссылки, получают тип mrid_dtype"""
+
+        data = {}
+        for column, values in self.columns.items():
+            values.extend([np.nan] * (self.size - len(values)))
+
+            if column not in self.ref_columns:
+                data[column] = values
+            elif column not in self.text_columns:
+                codes = np.nan_to_num(np.array(values, dtype=float), nan=-1).astype(np.int64)
+                data[column] = pd.Categorical.from_codes(codes, dtype=mrid_dtype)
+            else:
+                # В колонке и ссылки, и обычные значения - возвращаем строки mRID
+                data[column] = [self.mrids.values[value] if isinstance(value, int) else value for value in values]
+
+        return pd.DataFrame(data)
+
+
+class XmlReader:
+
+    def __init__(self, f_name: str, stream: bool = False, cache_dir: str = None, backend: str = None,
+                 encode_mrid: bool = True, compact: bool = False):
+        self.f_name = f_name
+        # Словарь mRID модели. Если не задан, mRID хранятся строками
+        self.mrids = MridDictionary() if encode_mrid else None
+        # Компактные типы колонок (числа, boolean, category, строки pyarrow), пропуски - NA
+        self.compact = compact
+        # Разборщик xml: lxml или xml.etree.ElementTree
+        self.backend = get_backend(backend)
+        # В потоковом режиме файл целиком в память не читается, таблицы собираются при разборе файла блоками.
+        # Пиковая память в разы меньше, но разбор медленнее: дерево lxml строится и освобождается по частям
+        self.stream = stream
+        # Кэш разобранных таблиц на диске
+        self.cache = TableCache(cache_dir) if cache_dir is not None else None
+        self.encoding = 'UTF-8'
+        self.bom_size = 0
+        self.namespaces = {}
+        # Имя корневого тега без префикса
+        self.root_name = None
+        self._root = None
+        self._file_hash = None
+
+        self._check_file()
+        # Кодировку и пространства имен определяем по началу файла
+        self._read_prolog()
+
+        # С кэшем файл разбирается только при первом обращении к дереву
+        if self.stream or self.cache is not None:
+            return
+
+        self._root = self._get_root()
+
+    def __getstate__(self) -> dict:
+        """При передаче в другой процесс дерево xml не копируется, оно будет разобрано заново при обращении"""
+        state = self.__dict__.copy()
+        state['_root'] = None
+        return state
+
+    @property
+    def root(self) -> ET.Element:
+        """Корень разобранного xml"""
+        if self._root is None:
+            self._root = self._get_root()
+        return self._root
+
+    @property
+    def file_hash(self) -> str:
+        """Хэш содержимого файла"""
+        if self._file_hash is None:
+            self._file_hash = file_hash(self.f_name)
+        return self._file_hash
+
+    def _check_file(self) -> None:
+        """Проверяет наличие файла без чтения его содержимого"""
+        if not os.path.isfile(self.f_name):
+            log.error(f"Файл {self.f_name} не найден")
+            raise FileNotFoundError
+
+    def _read_prolog(self) -> None:
+        """Определяет кодировку по BOM или объявлению xml (в т.ч. windows-1251),
+        а пространства имен - по корневому тегу. Читается только начало файла"""
+
+        with open(self.f_name, 'rb') as file:
+            head = file.read(PROLOG_SIZE)
+
+            # Кодировка по BOM
+            for bom, encoding in BOMS:
+                if head.startswith(bom):
+                    self.encoding = encoding
+                    self.bom_size = len(bom)
+                    break
+            else:
+                # Кодировка из объявления xml
+                declaration = DECLARATION_RE.match(head)
+                if declaration:
+                    self.encoding = declaration.group(1).decode('ascii')
+
+            try:
+                codecs.lookup(self.encoding)
+            except LookupError:
+                log.warning(f'Неизвестная кодировка {self.encoding}, используется UTF-8')
+                self.encoding = 'UTF-8'
+
+            # Корневой тег может не поместиться в первый блок
+            while True:
+                root_tag = ROOT_TAG_RE.search(head[self.bom_size:].decode(self.encoding, errors='ignore'))
+                chunk = file.read(PROLOG_SIZE) if root_tag is None else b''
+                if not chunk:
+                    break
+                head += chunk
+
+        log.info(f'Кодировка файла {self.encoding}')
+
+        if root_tag is not None:
+            self.root_name = root_tag.group(1).rpartition(':')[2]
+            for prefix, uri in NAMESPACE_RE.findall(root_tag.group(2)):
+                self.namespaces[prefix] = uri
 
     def _get_root(self) -> ET.Element:
-        """Разбор XML"""
-        log.info('Разбор xml')
+        """Разбор XML. Файл отображается в память и передается разборщику блоками байт без декодирования"""
+
+        log.info(f'Читаем xml-файл {self.f_name}')
+        try:
+            with open(self.f_name, 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            log.error(f"Произошла ошибка: {e}")
+            sys.exit(-1)
+
+        log.info(f'Разбор xml ({self.backend.name})')
         try:
-            root = ET.fromstring(self.xml_txt)
+            with buffer:
+                parser = self.backend.parser(self.encoding)
+                for pos in range(self.bom_size, len(buffer), CHUNK_SIZE):
+                    parser.feed(buffer[pos:pos + CHUNK_SIZE])
+                root = parser.close()
             log.info('Разбор xml успешно завершен')
         except Exception as e:
             log.error(f"Разбор xml завершился с ошибкой: {e}")
@@ -78,85 +348,181 @@ class XmlReader:
 
         return root
 
-    def get_data_by_list(self, tag_list: list[str]) -> dict[str: pd.DataFrame]:
-        """На вход получает список tag.
-        Возвращает словарь со структурой tag: pd.DataFrame"""
+    def contains(self, substring: str) -> bool:
+        """Проверяет, встречается ли подстрока в xml. Поиск идет по байтам файла без декодирования"""
 
-        out_dict = {}
-        for tag in tag_list:
-            data = self.get_data_by_tag(tag)
-            out_dict[tag] = data
+        pattern = substring.encode(self.encoding)
+        with open(self.f_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return buffer.find(pattern) != -1
+
+    def get_data_by_list(self, tag_list: list[str], schema: dict[str: list[str]] = None) -> dict[str: pd.DataFrame]:
+        """На вход получает список tag.
+        Возвращает словарь со структурой tag: pd.DataFrame.
+        Все таблицы собираются за один проход по документу.
+        schema - нужные колонки для таблиц (tag: список колонок), остальные дочерние теги пропускаются.
+        Таблицы, которых нет в schema, извлекаются целиком"""
+
+        schema = schema or {}
+
+        if self.cache is not None:
+            # Таблицы с кодами mRID и со строками mRID, компактные и обычные кэшируются отдельно
+            version = PARSER_VERSION if self.mrids is not None else f'{PARSER_VERSION}-str'
+            if self.compact:
+                version = f'{version}-compact'
+            key = self.cache.get_key(self.file_hash, tag_list, version, schema)
+            out_dict = self.cache.load(key)
+            if out_dict is not None:
+                if self.compact:
+                    for df in out_dict.values():
+                        df.attrs['compact'] = True
+                return out_dict
+
+        # Для каждого тега своя таблица
+        builders = {tag: TableBuilder(self.mrids, schema.get(tag)) for tag in tag_list}
+
+        for equipment in self._iter_elements():
+            # Направляем элемент в таблицу по имени тега без namespace
+            tag_name = self._local_name(equipment.tag)
+            builder = builders.get(tag_name)
+            if builder is None:
+                continue
+
+            self._add_equipment_data(builder, equipment, tag_name)
+
+        # Создаем DataFrame. Все таблицы получают один тип колонок mRID
+        mrid_dtype = self.mrids.get_dtype() if self.mrids is not None else None
+        out_dict = {tag: builder.to_frame(mrid_dtype) for tag, builder in builders.items()}
+        if self.compact:
+            out_dict = {tag: compact_frame(df) for tag, df in out_dict.items()}
+
+        if self.cache is not None:
+            self.cache.save(key, out_dict)
 
         return out_dict
 
-    def get_data_by_tag(self, parent_tag: str) -> pd.DataFrame:
+    def get_data_by_tag(self, parent_tag: str, columns: list[str] = None) -> pd.DataFrame:
         """Возвращает dataframe с данными по одному tag"""
 
-        # Список для хранения данных
-        data = []
-
-        # Находим все элементы тэга
-        # equipments = self.root.findall(f'.//cim:{parent_tag}', self.namespaces)
-        equipments = self.root.findall(f'{{*}}{parent_tag}')
-
-        for equipment in equipments:
-            equipment_data = {}
-
-            # Получаем id родильского элемента
-            equipment_attrs = equipment.attrib
-            if equipment_attrs:
-                for _, value in equipment_attrs.items():
-                    equipment_data[f"{parent_tag.lower()}_mRID"] = value.replace('#_', '')
-
-            # Обрабатываем все дочерние элементы
-            for child in equipment:
-                # Получаем имя тега без namespace
-                tag = child.tag
-                if '}' in tag:
-                    tag_name = tag.split('}', 1)[1]
-                else:
-                    tag_name = tag
-
-                # Если такой тэг уже есть, то обрабатываем
-                if tag_name in equipment_data.keys():
-                    all_name = [key for key in equipment_data.keys() if key.startswith(tag_name)]
-                    tag_name = f'{tag_name}_{len(all_name) + 1}'
-
-                # Получаем текстовое значение
-                text_value = child.text.strip() if child.text else None
-
-                # Получаем атрибуты
-                attrs = child.attrib
-                attr_data = {}
-
-                if attrs:
-                    for attr, value in attrs.items():
-                        if '}' in attr:
-                            attr_name = attr.split('}', 1)[1]
-                        else:
-                            attr_name = attr
-                        attr_data[attr_name] = value
-
-                # Глубоко вложенный inUseDate ищем отдельно
-                if tag_name == 'Asset.inUseDate':
-                    in_use_dates = equipment.find(f'.//{{{self.namespaces.get("cim")}}}InUseDate.inUseDate')
-
-                    if in_use_dates is not None:
-                        text_value = in_use_dates.text
-
-                # Сохраняем значение
-                if text_value:
-                    equipment_data[tag_name] = text_value
-                # Сохраняем атрибуты
-                elif attr_data:
-                    for attr_name, attr_value in attr_data.items():
-                        equipment_data[tag_name] = attr_value.replace('#_', '')
-                else:
-                    equipment_data[tag_name] = ''
-
-            data.append(equipment_data)
-
-        # Создаем DataFrame
-        df = pd.DataFrame(data)
-
-        return df
+        schema = {parent_tag: columns} if columns is not None else None
+        return self.get_data_by_list([parent_tag], schema)[parent_tag]
+
+    def _iter_elements(self) -> Iterator[ET.Element]:
+        """Возвращает элементы верхнего уровня (прямых потомков корня).
+        В обычном режиме обходит уже разобранное дерево, в потоковом - разбирает файл блоками"""
+
+        if not self.stream:
+            yield from self.root
+            return
+
+        yield from self._iter_stream()
+
+    def _iter_stream(self) -> Iterator[ET.Element]:
+        """Потоковый разбор xml. Файл передается разборщику блоками по CHUNK_SIZE байт,
+        событие нужно только для корня. После каждого блока отдаются все дочерние элементы корня,
+        кроме последнего (он может быть разобран не полностью), и затем удаляются из дерева.
+        Поэтому в памяти держится не больше одного блока элементов, а события для вложенных
+        тегов в python не обрабатываются. Пространства имен берутся из корневого тега"""
+
+        log.info(f'Потоковый разбор xml-файла {self.f_name} ({self.backend.name})')
+
+        parser = self.backend.pull_parser(self.root_name or '*')
+        root = None
+
+        try:
+            with open(self.f_name, 'rb') as file:
+                while True:
+                    chunk = file.read(CHUNK_SIZE)
+                    if chunk:
+                        parser.feed(chunk)
+                    else:
+                        parser.close()
+
+                    for _, item in parser.read_events():
+                        if root is None:
+                            root = item
+
+                    if root is not None:
+                        # После последнего блока разобраны все элементы
+                        done = max(len(root) - 1, 0) if chunk else len(root)
+                        elements = root[:done]
+                        del root[:done]
+                        yield from elements
+
+                    if not chunk:
+                        break
+            log.info('Разбор xml успешно завершен')
+        except Exception as e:
+            log.error(f"Разбор xml завершился с ошибкой: {e}")
+            sys.exit(-1)
+
+    @staticmethod
+    def _local_name(tag: str) -> str:
+        """Возвращает имя тега или атрибута без namespace"""
+        if '}' in tag:
+            return tag.split('}', 1)[1]
+        return tag
+
+    def _add_equipment_data(self, builder: TableBuilder, equipment: ET.Element, parent_tag: str) -> None:
+        """Добавляет в таблицу строку с данными одного элемента оборудования"""
+
+        builder.add_row()
+
+        # Получаем id родильского элемента
+        mrid = self._get_mrid(equipment)
+        if mrid is not None:
+            builder.set_ref(f"{parent_tag.lower()}_mRID", mrid)
+
+        # Обрабатываем все дочерние элементы
+        for child in equipment:
+            # Получаем имя тега без namespace. Повторяющиеся теги нумеруются
+            local_name = self._local_name(child.tag)
+            if not builder.is_wanted_tag(local_name):
+                continue
+            tag_name = builder.get_name(local_name)
+            if not builder.is_wanted(tag_name):
+                continue
+
+            # Получаем текстовое значение
+            text_value = child.text.strip() if child.text else None
+
+            # Глубоко вложенные значения (например, inUseDate) берем по заданному пути
+            nested_path = NESTED_PATHS.get(local_name)
+            if nested_path is not None:
+                nested = self._find_nested(child, nested_path)
+                if nested is not None:
+                    text_value = nested.text.strip() if nested.text else None
+
+            # Сохраняем значение
+            if text_value:
+                builder.set(tag_name, text_value)
+            # Сохраняем атрибуты (ссылка на другой объект)
+            elif child.attrib:
+                *_, attr_value = child.attrib.values()
+                builder.set_ref(tag_name, attr_value.replace('#_', ''))
+            else:
+                builder.set(tag_name, '')
+
+    @staticmethod
+    def _get_mrid(equipment: ET.Element) -> str | None:
+        """Возвращает mRID элемента (значение последнего атрибута) или None, если атрибутов нет"""
+
+        equipment_attrs = equipment.attrib
+        if not equipment_attrs:
+            return None
+
+        *_, value = equipment_attrs.values()
+        return value.replace('#_', '')
+
+    def _find_nested(self, element: ET.Element, path: tuple[str, ...]) -> ET.Element | None:
+        """Спускается от элемента по пути из имен тегов без namespace.
+        Возвращает найденный элемент или None"""
+
+        for tag_name in path:
+            for child in element:
+                if self._local_name(child.tag) == tag_name:
+                    element = child
+                    break
+            else:
+                return None
+
+        return element
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Модули проекта импортируются из src, как при запуске main.py
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from equipments import Breaker  # noqa: E402
+from xml_reader import XmlReader  # noqa: E402
+
+XML_TEXT = '''<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:cim="http://iec.ch/TC57/2014/CIM-schema-cim16#">
+<cim:Breaker rdf:about="#_br-1"><cim:IdentifiedObject.name>В-1</cim:IdentifiedObject.name></cim:Breaker>
+</rdf:RDF>
+'''
+
+
+def make_breaker(xml: XmlReader | None, rated_current: str = '630') -> Breaker:
+    """Выключатель с рассчитанными фактурами без разбора xml"""
+
+    breaker = Breaker(xml)
+    breaker.appendix_1 = pd.DataFrame({
+        'breaker_mRID': ['br-1', 'br-2'],
+        'IdentifiedObject.name_br': ['В-1', 'В-2'],
+        'IdentifiedObject.name_bay': ['Ячейка 1', 'Ячейка 2'],
+        'IdentifiedObject.name_voltlev': ['10 кВ', '10 кВ'],
+        'IdentifiedObject.name_subst': ['ПС 1', 'ПС 1'],
+        'Switch.ratedCurrent': [rated_current, '1000'],
+        'Equipment.normallyInService': ['true', 'EMPTY'],
+    })
+    breaker.appendix_2_1 = pd.DataFrame({
+        'currentlimit_mRID': ['cl-1', 'cl-2'],
+        'CurrentLimit.value': ['630', '0.06'],
+        'breaker_mRID': ['br-1', 'br-2'],
+        '-20': ['100', '105'],
+    })
+    breaker.appendix_2_2 = pd.DataFrame({
+        'voltagelimit_mRID': ['vl-1'],
+        'VoltageLimit.value': ['11.5'],
+        'breaker_mRID': ['br-1'],
+    })
+    breaker.appendix_2_2_pivot = pd.DataFrame({'breaker_mRID': ['br-1'], 'Наибольшее': ['11.5']})
+
+    return breaker
+
+
+@pytest.fixture
+def xml(tmp_path) -> XmlReader:
+    f_name = tmp_path / 'model.xml'
+    f_name.write_text(XML_TEXT, encoding='utf-8')
+    return XmlReader(str(f_name))
@@ -0,0 +1,81 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from tools.cache import TableCache
+from xml_reader import XmlReader
+
+XML_TEXT = '''<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:cim="http://iec.ch/TC57/2014/CIM-schema-cim16#">
+<cim:Breaker rdf:about="#_br-1"><cim:IdentifiedObject.name>В-1</cim:IdentifiedObject.name>
+<cim:Equipment.EquipmentContainer rdf:resource="#_bay-1"/></cim:Breaker>
+<cim:Breaker rdf:about="#_br-2"><cim:IdentifiedObject.name>В-2</cim:IdentifiedObject.name>
+<cim:Equipment.EquipmentContainer rdf:resource="#_bay-2"/></cim:Breaker>
+<cim:Terminal rdf:about="#_t-1"><cim:Terminal.ConductingEquipment rdf:resource="#_br-1"/></cim:Terminal>
+<cim:Terminal rdf:about="#_t-2"><cim:Terminal.ConductingEquipment rdf:resource="#_br-2"/>
+<cim:ACDCTerminal.sequenceNumber>2</cim:ACDCTerminal.sequenceNumber></cim:Terminal>
+</rdf:RDF>
+'''
+
+TAGS = ['Breaker', 'Terminal']
+
+
+@pytest.fixture
+def model(tmp_path) -> str:
+    f_name = tmp_path / 'model.xml'
+    f_name.write_text(XML_TEXT, encoding='utf-8')
+    return str(f_name)
+
+
+@pytest.mark.parametrize('encode_mrid', [True, False])
+def test_cache_round_trip(model, tmp_path, encode_mrid):
+    cache_dir = str(tmp_path / 'cache')
+    parsed = XmlReader(model, cache_dir=cache_dir, encode_mrid=encode_mrid).get_data_by_list(TAGS)
+    loaded = XmlReader(model, cache_dir=cache_dir, encode_mrid=encode_mrid).get_data_by_list(TAGS)
+
+    for tag in TAGS:
+        pd.testing.assert_frame_equal(loaded[tag], parsed[tag])
+
+
+def test_cache_hit_does_not_parse(model, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    XmlReader(model, cache_dir=cache_dir).get_data_by_list(TAGS)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('файл разбирается повторно')
+
+    monkeypatch.setattr(XmlReader, '_iter_elements', fail)
+    monkeypatch.setattr(XmlReader, '_get_root', fail)
+    tables = XmlReader(model, cache_dir=cache_dir).get_data_by_list(TAGS)
+
+    assert tables['Terminal']['Terminal.ConductingEquipment'].astype(str).tolist() == ['br-1', 'br-2']
+
+
+def test_cache_stores_mrid_dictionary_once(model, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    tables = XmlReader(model, cache_dir=cache_dir).get_data_by_list(TAGS)
+
+    categorical = [column for df in tables.values() for column in df.columns
+                   if isinstance(df[column].dtype, pd.CategoricalDtype)]
+    assert len(categorical) > 1
+    assert len(glob.glob(os.path.join(cache_dir, '*', 'categories_*'))) == 1
+
+
+def test_cache_prune(tmp_path):
+    cache = TableCache(str(tmp_path))
+    table = {'Breaker': pd.DataFrame({'breaker_mRID': [f'br-{i}' for i in range(1000)]})}
+    for i, key in enumerate(['old', 'used', 'new']):
+        cache.save(key, table)
+        os.utime(os.path.join(str(tmp_path), key, TableCache.manifest_name), (i, i))
+    # Снимок и чужая папка не удаляются
+    cache.save('snapshot', table, meta={'equipment': 'Breaker'})
+    os.makedirs(tmp_path / 'notes')
+
+    # Загрузка обновляет время использования набора
+    assert cache.load('used') is not None
+    set_size = sum(item.stat().st_size for item in os.scandir(tmp_path / 'new'))
+    cache.prune(2 * set_size)
+
+    assert sorted(os.listdir(tmp_path)) == ['new', 'notes', 'snapshot', 'used']
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from comparer import NUMERIC_TOLERANCES, Comparer, Tolerance, get_fingerprints, get_tolerance, is_close
+from tools.dtypes import NUMERIC_COLUMNS
+
+
+def make_tables() -> tuple[pd.DataFrame, pd.DataFrame]:
+    first = pd.DataFrame({
+        'breaker_mRID': ['br-3', 'br-1', 'br-2', 'br-5', 'br-6'],
+        'bay_mRID': ['bay-3', 'bay-1', 'bay-2', 'bay-5', 'bay-6'],
+        'Switch.ratedCurrent': ['630', '1000', '630', '2000', '3150'],
+        'IdentifiedObject.description': ['', np.nan, 'резерв', 'EMPTY', np.nan],
+    })
+    second = pd.DataFrame({
+        'breaker_mRID': ['br-4', 'br-2', 'br-6', 'br-1', 'br-3'],
+        'bay_mRID': ['bay-4', 'bay-2', 'bay-6', 'bay-1', 'bay-9'],
+        'Switch.ratedCurrent': ['630', '630.0', '3150', '1250', '630'],
+        'IdentifiedObject.description': ['', 'резерв', np.nan, np.nan, np.nan],
+    })
+    return first, second
+
+
+def encode(df: pd.DataFrame, dictionary: list[str]) -> pd.DataFrame:
+    """Колонки mRID в виде кодов словаря модели (как XmlReader с encode_mrid)"""
+
+    dtype = pd.CategoricalDtype(categories=dictionary)
+    return df.astype({'breaker_mRID': dtype, 'bay_mRID': dtype})
+
+
+def test_codes_compare_as_strings():
+    first, second = make_tables()
+    expected = Comparer(first, second, 'breaker_mRID')
+    expected_df = expected.run()
+
+    # Словари двух моделей разные и не упорядочены по значению
+    first_codes = encode(first, ['EMPTY', 'bay-5', 'br-5', 'br-3', 'bay-3', 'br-1', 'bay-1', 'br-6', 'bay-6', 'br-2', 'bay-2'])
+    second_codes = encode(second, ['EMPTY', 'br-4', 'bay-4', 'bay-9', 'br-3', 'br-2', 'bay-2', 'br-1', 'bay-6', 'br-6', 'bay-1'])
+    comparer = Comparer(first_codes, second_codes, 'breaker_mRID')
+    result_df = comparer.run()
+
+    assert result_df['breaker_mRID'].tolist() == ['br-1', 'br-2', 'br-3', 'br-6', 'br-5', 'br-4']
+    pd.testing.assert_frame_equal(result_df.astype(str), expected_df.astype(str))
+    pd.testing.assert_frame_equal(comparer.changes.astype(str), expected.changes.astype(str))
+
+
+def test_fingerprints_find_same_changes_as_full_comparison(monkeypatch):
+    first, second = make_tables()
+
+    fast = Comparer(first, second, 'breaker_mRID')
+    fast_df = fast.run()
+    snapshot = Comparer(first, second, 'breaker_mRID',
+                        second_fingerprints=get_fingerprints(second, 'breaker_mRID'))
+    snapshot_df = snapshot.run()
+
+    # Полное сравнение: поячеечно сравниваются все общие строки
+    monkeypatch.setattr(Comparer, '_get_changed_rows', lambda self, first_, second_: np.ones(len(first_), dtype=bool))
+    full = Comparer(first, second, 'breaker_mRID')
+    full_df = full.run()
+
+    # 630 и 630.0 - одно значение, пустая строка и пропуск - разные
+    assert full.changes[['breaker_mRID', 'column', 'compare_flg']].values.tolist() == [
+        ['br-3', 'bay_mRID', 'Изменено'],
+        ['br-1', 'Switch.ratedCurrent', 'Изменено'],
+        ['br-3', 'IdentifiedObject.description', 'Изменено'],
+        ['br-5', 'breaker_mRID', 'Добавлено'],
+        ['br-4', 'breaker_mRID', 'Удалено'],
+    ]
+    for comparer, df in ((fast, fast_df), (snapshot, snapshot_df)):
+        pd.testing.assert_frame_equal(df, full_df)
+        pd.testing.assert_frame_equal(comparer.changes, full.changes)
+
+
+@pytest.mark.parametrize('column, abs_tol, rel_tol', [
+    ('Switch.ratedCurrent', 1e-6, 0.0),
+    ('CurrentLimit.value', 1e-6, 0.0),
+    ('ProtectedSwitch.breakingCapacity', 1e-6, 0.0),
+    ('SwitchInfo.ratedVoltage', 1e-9, 1e-9),
+    ('-20', 1e-6, 0.0),
+    ('40.0', 1e-6, 0.0),
+])
+def test_numeric_tolerances(column, abs_tol, rel_tol):
+    tolerance = get_tolerance(column, NUMERIC_TOLERANCES)
+
+    assert (tolerance.abs_tol, tolerance.rel_tol) == (abs_tol, rel_tol)
+
+
+def test_numeric_columns_have_tolerance():
+    # Колонки, числовые в компактных таблицах, сравниваются как числа
+    assert [column for column in NUMERIC_COLUMNS if get_tolerance(column, NUMERIC_TOLERANCES) is None] == []
+
+
+@pytest.mark.parametrize('column', ['IdentifiedObject.name', 'Switch.ratedCurrent_2', 'breaker_mRID'])
+def test_text_columns_have_no_tolerance(column):
+    assert get_tolerance(column, NUMERIC_TOLERANCES) is None
+
+
+def test_is_close():
+    first = np.array(['630', '630', '1e3', '', 'EMPTY', 'текст', '110.00001'], dtype=object)
+    second = np.array(['630.0', '630.4', '1000', '', 'EMPTY', 'текст', '110'], dtype=object)
+
+    # Пропуски и текст числами не считаются
+    assert is_close(first, second, Tolerance(abs_tol=1e-6)).tolist() == [True, False, True, False, False, False, False]
+    assert is_close(first, second, Tolerance(abs_tol=0.5)).tolist()[:2] == [True, True]
+    assert is_close(first, second, Tolerance(rel_tol=1e-6)).tolist()[-1]
+
+
+def test_tolerance_in_comparison():
+    first, second = make_tables()
+    second['Switch.ratedCurrent'] = ['630', '630.4', '3150', '1250', '630']
+
+    default = Comparer(first, second, 'breaker_mRID')
+    default.run()
+    wide = Comparer(first, second, 'breaker_mRID',
+                    tolerances={r'Switch\.ratedCurrent': Tolerance(abs_tol=0.5)})
+    wide.run()
+
+    def changed_current(comparer: Comparer) -> list[str]:
+        changes = comparer.changes
+        return sorted(changes.loc[changes['column'] == 'Switch.ratedCurrent', 'breaker_mRID'])
+
+    assert changed_current(default) == ['br-1', 'br-2']
+    assert changed_current(wide) == ['br-1']
+
+
+def test_match_keys():
+    # Модель выгружена повторно: у части выключателей новые mRID, имя и ячейка прежние
+    first = pd.DataFrame({
+        'breaker_mRID': ['new-1', 'new-2', 'new-3', 'new-4', 'br-5'],
+        'IdentifiedObject.name': ['В-1', 'В-2', 'В-3', 'В-3', 'В-5'],
+        'IdentifiedObject.name_bay': ['Ячейка 1', ' ячейка  2', 'Ячейка 3', 'Ячейка 3', 'Ячейка 5'],
+        'Switch.ratedCurrent': ['630', '1000', '630', '630', '630'],
+    })
+    second = pd.DataFrame({
+        'breaker_mRID': ['old-1', 'old-2', 'old-3', 'br-5'],
+        'IdentifiedObject.name': ['В-1', 'В-2', 'В-3', 'В-5'],
+        'IdentifiedObject.name_bay': ['Ячейка 1', 'Ячейка 2', 'Ячейка 3', 'Ячейка 5'],
+        'Switch.ratedCurrent': ['630', '1250', '630', '630'],
+    })
+
+    comparer = Comparer(first, second, 'breaker_mRID',
+                        match_keys=['IdentifiedObject.name', 'IdentifiedObject.name_bay'])
+    result_df = comparer.run()
+
+    # Ключ В-3 неоднозначен в первой таблице, такие строки не сопоставляются
+    assert comparer.matched == {'new-1': 'old-1', 'new-2': 'old-2'}
+    assert sorted(result_df['breaker_mRID']) == ['br-5', 'new-1&\nold-1', 'new-2&\nold-2', 'new-3', 'new-4', 'old-3']
+    assert result_df.loc[result_df['breaker_mRID'] == 'new-2&\nold-2', 'Switch.ratedCurrent'].tolist() == ['1000&\n1250']
+
+    changes = comparer.changes
+    assert changes.loc[changes['column'] == 'breaker_mRID', ['breaker_mRID', 'old', 'new', 'compare_flg']]\
+        .values.tolist() == [['new-1', 'old-1', 'new-1', 'Изменено'], ['new-2', 'old-2', 'new-2', 'Изменено'],
+                             ['new-3', '', 'new-3', 'Добавлено'], ['new-4', '', 'new-4', 'Добавлено'],
+                             ['old-3', 'old-3', '', 'Удалено']]
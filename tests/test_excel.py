@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools import excel
+from tools.excel import Sheet, write_workbooks
+
+TABLE = pd.DataFrame({
+    'breaker_mRID': pd.Categorical(['br-1', 'br-2', 'br-3', 'br-4', 'br-5']),
+    'IdentifiedObject.name_br': ['В-1', None, 'В-3', 'В-4', 'В-5'],
+    'Switch.ratedCurrent': pd.array([630, 1000, pd.NA, 630, 2000], dtype='Int64'),
+    'SwitchInfo.ratedVoltage': [110.0, np.nan, 10.5, 35.0, 220.0],
+})
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_write_workbooks(tmp_path, monkeypatch, parallel):
+    # Строки записываются несколькими блоками, книги - в отдельных процессах
+    monkeypatch.setattr(excel, 'CHUNK_SIZE', 2)
+    monkeypatch.setattr(excel.os, 'cpu_count', lambda: 2)
+
+    sheet = Sheet(TABLE)
+    long_name, short_name = str(tmp_path / 'long.xlsx'), str(tmp_path / 'short.xlsx')
+    assert write_workbooks({long_name: {'breaker': sheet},
+                            short_name: {'breaker': sheet.select(['Switch.ratedCurrent', 'breaker_mRID'])}},
+                           parallel=parallel) == [long_name, short_name]
+
+    long_df = pd.read_excel(long_name, sheet_name='breaker')
+    assert long_df.columns.tolist() == TABLE.columns.tolist()
+    assert long_df['breaker_mRID'].tolist() == ['br-1', 'br-2', 'br-3', 'br-4', 'br-5']
+    assert long_df['IdentifiedObject.name_br'].isna().tolist() == [False, True, False, False, False]
+    assert long_df['Switch.ratedCurrent'].isna().tolist() == [False, False, True, False, False]
+    assert long_df['SwitchInfo.ratedVoltage'].fillna(-1).tolist() == [110.0, -1, 10.5, 35.0, 220.0]
+
+    short_df = pd.read_excel(short_name, sheet_name='breaker')
+    assert short_df.columns.tolist() == ['Switch.ratedCurrent', 'breaker_mRID']
+    assert short_df['breaker_mRID'].tolist() == ['br-1', 'br-2', 'br-3', 'br-4', 'br-5']
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_breaker
+from equipments import Breaker
+from tools.export import read_tables, write_tables
+
+FORMATS = ['parquet', 'feather', 'csv']
+
+
+@pytest.fixture
+def tables() -> dict[str: pd.DataFrame]:
+    # Значения, которые csv без сохраненных типов прочитал бы иначе
+    return {
+        'compare': pd.DataFrame({
+            'breaker_mRID': pd.Categorical(['br-1', 'br-2', 'br-3']),
+            'Equipment.normallyInService': ['true', 'false', ''],
+            'Switch.ratedCurrent': ['630', '630&\\n1000', np.nan],
+            'CurrentLimit.value': ['0.06', '', '0.060'],
+            'compare_flg': pd.Categorical(['Изменено', 'Добавлено', 'Удалено']),
+        }),
+        'compact': pd.DataFrame({
+            'nominalVoltage': pd.array([10, None, 110], dtype='Int64'),
+            'temperature': pd.array([0.5, 1.0, None], dtype='Float64'),
+            'isDC': pd.array([True, None, False], dtype='boolean'),
+            'name': pd.array(['ПС 1', None, ''], dtype='string'),
+            'value': [1.5, np.nan, 3.0],
+        }),
+    }
+
+
+@pytest.mark.parametrize('export_format', FORMATS)
+def test_round_trip_keeps_values_and_types(tmp_path, tables, export_format):
+    write_tables(str(tmp_path), tables, export_format)
+
+    loaded = read_tables(str(tmp_path))
+
+    for name, df in tables.items():
+        pd.testing.assert_frame_equal(loaded[name], df, check_categorical=False)
+
+
+@pytest.mark.parametrize('export_format', FORMATS)
+def test_load_export_restores_comparison(xml, tmp_path, export_format):
+    breaker = make_breaker(xml, rated_current='1000')
+    breaker.compare(make_breaker(xml))
+    breaker.export(str(tmp_path), export_format)
+
+    loaded = Breaker.load_export(str(tmp_path))
+
+    for name in Breaker.export_tables:
+        pd.testing.assert_frame_equal(getattr(loaded, name), getattr(breaker, name).reset_index(drop=True),
+                                      check_categorical=False)
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from join_plan import JoinPlan, JoinStep
+
+BREAKER = pd.DataFrame({
+    'breaker_mRID': ['br-1', 'br-2', 'br-3', 'br-4'],
+    'IdentifiedObject.name': ['В-1', 'В-2', 'В-3', 'В-4'],
+    'Equipment.EquipmentContainer': ['bay-1', 'bay-2', 'bay-1', 'bay-9'],
+})
+BAY = pd.DataFrame({
+    'bay_mRID': ['bay-1', 'bay-2'],
+    'IdentifiedObject.name': ['Ячейка 1', 'Ячейка 2'],
+})
+# У выключателя br-1 два терминала, у br-4 - ни одного
+TERMINAL = pd.DataFrame({
+    'terminal_mRID': ['t-1', 't-2', 't-3', 't-4'],
+    'Terminal.ConductingEquipment': ['br-1', 'br-2', 'br-1', 'br-3'],
+    'IdentifiedObject.name': ['Т-1', 'Т-2', 'Т-3', 'Т-4'],
+})
+
+
+def make_plan(breaker: pd.DataFrame, bay: pd.DataFrame, terminal: pd.DataFrame, columns: list[str] = None) -> JoinPlan:
+    return JoinPlan(breaker, [
+        JoinStep(bay, 'Equipment.EquipmentContainer', 'bay_mRID', suffixes=('_br', '_bay')),
+        JoinStep(terminal, 'breaker_mRID', 'Terminal.ConductingEquipment'),
+    ], columns)
+
+
+def merge_chain(breaker: pd.DataFrame, bay: pd.DataFrame, terminal: pd.DataFrame) -> pd.DataFrame:
+    """Те же соединения последовательными вызовами merge"""
+
+    df = breaker.merge(bay, left_on='Equipment.EquipmentContainer', right_on='bay_mRID', how='left',
+                       suffixes=('_br', '_bay'))
+    return df.merge(terminal, left_on='breaker_mRID', right_on='Terminal.ConductingEquipment', how='left',
+                    suffixes=('_left', '_right'))
+
+
+def encode(*tables: pd.DataFrame) -> list[pd.DataFrame]:
+    """Колонки mRID и ссылок в виде кодов общего словаря модели"""
+
+    mrid_columns = ['breaker_mRID', 'Equipment.EquipmentContainer', 'bay_mRID', 'terminal_mRID',
+                    'Terminal.ConductingEquipment']
+    values = pd.unique(pd.concat([df[column] for df in tables for column in mrid_columns if column in df]))
+    dtype = pd.CategoricalDtype(['EMPTY', *values[::-1]])
+    return [df.astype({column: dtype for column in mrid_columns if column in df}) for df in tables]
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_join_plan_matches_merge(encoded):
+    tables = encode(BREAKER, BAY, TERMINAL) if encoded else [BREAKER, BAY, TERMINAL]
+
+    result = make_plan(*tables).run()
+    expected = merge_chain(*tables)
+
+    assert result.columns.tolist() == expected.columns.tolist()
+    # Строка br-1 размножена по двум терминалам
+    assert result['terminal_mRID'].astype(object).tolist()[:3] == ['t-1', 't-3', 't-2']
+    pd.testing.assert_frame_equal(result.astype(object), expected.astype(object))
+
+
+def test_join_plan_columns():
+    columns = ['breaker_mRID', 'IdentifiedObject.name_bay', 'terminal_mRID']
+
+    result = make_plan(BREAKER, BAY, TERMINAL, columns).run()
+
+    pd.testing.assert_frame_equal(result, merge_chain(BREAKER, BAY, TERMINAL)[columns])
+
+
+def test_join_plan_first_filled_key():
+    # Ссылка на ячейку может быть в одной из двух колонок: берется первая заполненная
+    breaker = BREAKER.assign(**{'Equipment.EquipmentContainer': 'EMPTY',
+                                'Switch.Bay': BREAKER['Equipment.EquipmentContainer']})
+    plan = JoinPlan(breaker, [JoinStep(BAY, ('Equipment.EquipmentContainer', 'Switch.Bay'), 'bay_mRID')])
+
+    assert plan.run()['bay_mRID'].tolist()[:3] == ['bay-1', 'bay-2', 'bay-1']
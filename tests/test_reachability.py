@@ -0,0 +1,40 @@
+import pandas as pd
+
+from reachability import Link, find_reachable
+
+LINKS = [
+    Link('Breaker', 'Equipment.EquipmentContainer', 'Bay'),
+    Link('Terminal', 'Terminal.ConductingEquipment', 'Breaker', reverse=True),
+    Link('OperationalLimitSet', 'OperationalLimitSet.Terminal', 'Terminal', reverse=True),
+]
+
+
+def make_tables() -> dict[str: pd.DataFrame]:
+    return {
+        'Breaker': pd.DataFrame({'breaker_mRID': ['br-1', 'br-2'],
+                                 'Equipment.EquipmentContainer': ['bay-1', None]}),
+        'Bay': pd.DataFrame({'bay_mRID': ['bay-1', 'bay-2']}),
+        # Терминал t-3 относится к другому оборудованию, у t-4 нет ссылки
+        'Terminal': pd.DataFrame({'terminal_mRID': ['t-1', 't-2', 't-3', 't-4'],
+                                  'Terminal.ConductingEquipment': ['br-1', 'br-2', 'ln-1', None]}),
+        # Набор ls-1 ссылается на терминал, найденный на предыдущем шаге
+        'OperationalLimitSet': pd.DataFrame({'operationallimitset_mRID': ['ls-1', 'ls-2'],
+                                             'OperationalLimitSet.Terminal': ['t-1', 't-3']}),
+    }
+
+
+def test_find_reachable():
+    reached = find_reachable(make_tables(), 'Breaker', LINKS)
+
+    assert reached == {'Breaker': {'br-1', 'br-2'}, 'Bay': {'bay-1'}, 'Terminal': {'t-1', 't-2'},
+                       'OperationalLimitSet': {'ls-1'}}
+
+
+def test_find_reachable_by_codes():
+    # Колонки mRID с кодами словаря модели отбираются так же, как строки
+    tables = make_tables()
+    dtype = pd.CategoricalDtype(['EMPTY', 'ls-2', 't-3', 'ln-1', 'ls-1', 't-1', 't-2', 't-4',
+                                 'br-2', 'br-1', 'bay-2', 'bay-1'])
+    tables = {tag: df.astype(dtype) for tag, df in tables.items()}
+
+    assert find_reachable(tables, 'Breaker', LINKS) == find_reachable(make_tables(), 'Breaker', LINKS)
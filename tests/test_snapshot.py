@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_breaker
+from equipments import Breaker
+
+
+def test_snapshot_round_trip(xml, tmp_path):
+    breaker = make_breaker(xml)
+    breaker.save_snapshot(str(tmp_path / 'snapshot'))
+
+    snapshot = Breaker.load_snapshot(str(tmp_path / 'snapshot'))
+
+    assert snapshot.xml is None
+    assert snapshot.source == xml.f_name
+    for name in Breaker.snapshot_tables:
+        pd.testing.assert_frame_equal(getattr(snapshot, name), getattr(breaker, name))
+
+
+def test_snapshot_save_error_raises(xml, tmp_path):
+    # Папка снимка внутри файла создана быть не может
+    with pytest.raises(OSError):
+        make_breaker(xml).save_snapshot(xml.f_name + '/snapshot')
+
+
+def test_compare_snapshot_with_live_both_directions(xml, tmp_path):
+    make_breaker(xml).save_snapshot(str(tmp_path / 'snapshot'))
+    snapshot = Breaker.load_snapshot(str(tmp_path / 'snapshot'))
+
+    live = make_breaker(xml, rated_current='1000')
+    live.compare(snapshot)
+    assert live.changes_1[['breaker_mRID', 'column', 'old', 'new']].values.tolist() == \
+        [['br-1', 'Switch.ratedCurrent', '630', '1000']]
+
+    snapshot.compare(live)
+    assert snapshot.changes_1[['breaker_mRID', 'column', 'old', 'new']].values.tolist() == \
+        [['br-1', 'Switch.ratedCurrent', '1000', '630']]
+    assert snapshot.compared_with == {'file': xml.f_name, 'hash': xml.file_hash}
+
+
+def test_snapshot_overwrites_previous_snapshot(xml, tmp_path):
+    make_breaker(xml).save_snapshot(str(tmp_path / 'snapshot'))
+    make_breaker(xml, rated_current='1000').save_snapshot(str(tmp_path / 'snapshot'))
+
+    snapshot = Breaker.load_snapshot(str(tmp_path / 'snapshot'))
+    assert snapshot.appendix_1['Switch.ratedCurrent'].tolist() == ['1000', '1000']
+
+
+def test_snapshot_keeps_foreign_directory(xml, tmp_path):
+    notes = tmp_path / 'snapshot' / 'notes.txt'
+    notes.parent.mkdir()
+    notes.write_text('заметки', encoding='utf-8')
+
+    with pytest.raises(FileExistsError):
+        make_breaker(xml).save_snapshot(str(notes.parent))
+
+    assert notes.read_text(encoding='utf-8') == 'заметки'
+    assert sorted(os.listdir(tmp_path)) == ['model.xml', 'snapshot']
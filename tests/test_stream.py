@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+import xml_reader
+from xml_reader import XmlReader
+
+XML_TEXT = '''<?xml version="1.0" encoding="windows-1251"?>
+<!-- выгрузка модели -->
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:cim="http://iec.ch/TC57/2014/CIM-schema-cim16#">
+<cim:Breaker rdf:about="#_br-1"><cim:IdentifiedObject.name>Выключатель 1</cim:IdentifiedObject.name>
+<cim:Equipment.EquipmentContainer rdf:resource="#_bay-1"/></cim:Breaker>
+<cim:Asset rdf:about="#_as-1"><cim:Asset.inUseDate><cim:InUseDate>
+<cim:InUseDate.inUseDate>2020-01-01</cim:InUseDate.inUseDate></cim:InUseDate></cim:Asset.inUseDate></cim:Asset>
+<cim:Breaker rdf:about="#_br-2"><cim:IdentifiedObject.name>Выключатель 2</cim:IdentifiedObject.name>
+<cim:IdentifiedObject.name>Второе имя</cim:IdentifiedObject.name></cim:Breaker>
+</rdf:RDF>
+'''
+
+TAGS = ['Breaker', 'Asset']
+
+
+@pytest.mark.parametrize('backend', ['lxml', 'etree'])
+def test_stream_matches_tree(tmp_path, monkeypatch, backend):
+    f_name = tmp_path / 'model.xml'
+    f_name.write_bytes(XML_TEXT.encode('windows-1251'))
+    tree = XmlReader(str(f_name), backend=backend).get_data_by_list(TAGS)
+
+    # Блоки меньше элемента: элементы разбираются по частям в нескольких блоках
+    monkeypatch.setattr(xml_reader, 'CHUNK_SIZE', 64)
+    stream = XmlReader(str(f_name), stream=True, backend=backend).get_data_by_list(TAGS)
+
+    for tag in TAGS:
+        pd.testing.assert_frame_equal(stream[tag], tree[tag])
+    assert stream['Breaker']['IdentifiedObject.name_2'].tolist()[1] == 'Второе имя'
+    assert stream['Asset']['Asset.inUseDate'].tolist() == ['2020-01-01']